@@ -4,13 +4,18 @@ Main Streamlit Application
 """
 import streamlit as st
 import os
+import functools
+import threading
+import orjson
+import time
+from concurrent.futures import Future
 from datetime import datetime
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 
 # Import our custom modules
-from src.agent import agent as studymate_agent
-from src.graph_viz import graph_visualizer
+# (the agent, graph visualizer and LLM stacks are imported lazily below so
+# they don't pull langchain/torch/pyvis in before the first paint)
 from config.neo4j_config import neo4j_config
-from config.llm_config import llm_config
 
 # Configure Streamlit page
 st.set_page_config(
@@ -69,8 +74,36 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@functools.lru_cache(maxsize=None)
+def _agent():
+    """StudyMate agent, imported on first use"""
+    from src.agent_interface import agent
+    return agent
+
+@functools.lru_cache(maxsize=None)
+def _graph_visualizer():
+    """Graph visualizer, imported on first use"""
+    from src.graph_viz import graph_visualizer
+    return graph_visualizer
+
+def _warm_plans():
+    """Create the Neo4j schema and compile query plans (runs on a background thread)"""
+    from src.neo4j_client import neo4j_client
+    # Schema first, so the warmed plans already use its indexes
+    neo4j_client.ensure_schema()
+    neo4j_client.warm_query_plans()
+
+@st.cache_resource
+def _start_plan_warmup():
+    """Set up the Neo4j schema and plan cache in the background, once per process"""
+    thread = threading.Thread(target=_warm_plans, daemon=True)
+    thread.start()
+    return thread
+
 def initialize_session_state():
     """Initialize session state variables"""
+    _start_plan_warmup()
+    
     if 'user_id' not in st.session_state:
         # In production, use proper authentication
         st.session_state.user_id = f"student_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -80,9 +113,19 @@ def initialize_session_state():
     
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = []
+    
+    if 'graph_version' not in st.session_state:
+        # Bumped after every successful upload; keys the cached graph export
+        st.session_state.graph_version = 0
+    
+    if 'dep_status' not in st.session_state:
+        # Last known dependency check result (issues is None until the first probe)
+        # and the pending background refresh, if any
+        st.session_state.dep_status = {"issues": None, "ts": 0, "refresh": None}
 
-def check_dependencies():
-    """Check if all dependencies are configured"""
+@st.cache_resource(ttl=300)
+def _probe_dependencies():
+    """Probe Neo4j and the LLM; cached so it runs at most every 5 minutes"""
     issues = []
     
     # Check Neo4j connection
@@ -95,12 +138,43 @@ def check_dependencies():
     
     # Test LLM connection
     try:
+        from config.llm_config import llm_config
         llm_config.test_connection()
     except Exception as e:
         issues.append(f"❌ LLM connection failed: {str(e)}")
     
     return issues
 
+def check_dependencies():
+    """Check if all dependencies are configured"""
+    return _probe_dependencies()
+
+# Seconds before the sidebar status is re-probed (always in the background)
+DEPENDENCY_REFRESH_SECONDS = 60
+
+def _start_dependency_refresh() -> Future:
+    """Run the dependency check off the UI thread; the script thread reads the result"""
+    future = Future()
+    
+    def refresh():
+        try:
+            future.set_result(check_dependencies())
+        except Exception as e:
+            future.set_exception(e)
+    
+    thread = threading.Thread(target=refresh, daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    return future
+
+@st.fragment(run_every=1)
+def _pending_dependency_status():
+    """Placeholder until the first dependency check finishes, then rerun the app to show it"""
+    refresh = st.session_state.dep_status.get("refresh")
+    if refresh is None or refresh.done():
+        st.rerun()
+    st.markdown("⏳ Checking system status...")
+
 def render_header():
     """Render the application header"""
 
@@ -136,13 +210,10 @@ def render_upload_section():
         if st.button("🚀 Process & Index", type="primary"):
             with st.spinner("Processing file..."):
                 try:
-                    # Read file data
-                    file_data = uploaded_file.read()
-                    
-                    # Process with agent
-                    result = studymate_agent.upload(
+                    # Process with agent (UploadedFile is passed as a file-like object)
+                    result = _agent().upload(
                         user_id=st.session_state.user_id,
-                        file_data=file_data,
+                        file_obj=uploaded_file,
                         filename=uploaded_file.name
                     )
                     
@@ -154,6 +225,7 @@ def render_upload_section():
                             "type": result.get("file_type", "unknown"),
                             "timestamp": datetime.now().isoformat()
                         })
+                        st.session_state.graph_version += 1
                         
                         # Show success message
                         st.markdown(f"""
@@ -186,6 +258,10 @@ def render_upload_section():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def _stream_answer(user_id: str, question: str, result: dict):
+    """Yield the agent's streamed answer and store its final result in `result`"""
+    result.update((yield from _agent().ask_stream(user_id=user_id, question=question)))
+
 def render_chat_section():
     """Render chat query section"""
     st.markdown('<div class="chat-section">', unsafe_allow_html=True)
@@ -217,37 +293,29 @@ def render_chat_section():
     if ask_button and question:
         with st.spinner("Generating answer..."):
             try:
-                # Query with agent
-                result = studymate_agent.ask(
-                    user_id=st.session_state.user_id,
-                    question=question
-                )
+                # Stream the answer from the agent as it is generated
+                answer_header = st.empty()
+                answer_header.markdown("#### 🎯 Answer")
+                result = {}
+                answer = st.write_stream(_stream_answer(
+                    st.session_state.user_id,
+                    question,
+                    result
+                ))
                 
-                if result.get("success"):
-                    answer = result.get("query_result", {}).get("answer", "No answer generated")
+                query_result = result.get("query_result", {})
+                if result.get("success") and query_result.get("success"):
+                    # Intent label returned with the answer (see INTENT_LINE_INSTRUCTION)
+                    if query_result.get("intent"):
+                        st.caption(f"Question type: {query_result['intent'].replace('_', ' ')}")
                     
                     # Add to chat history
                     st.session_state.chat_history.append((question, answer))
-                    
-                    # Display answer
-                    st.markdown("#### 🎯 Answer")
-                    st.markdown(answer)
-                    
-                    # Show context if available
-                    context = result.get("query_result", {}).get("context", {})
-                    if context:
-                        st.markdown("#### 📊 Query Context")
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Documents Found", context.get("documents_found", 0))
-                        with col2:
-                            st.metric("Graph Entities", context.get("graph_entities", 0))
-                        with col3:
-                            st.metric("Relationships", context.get("graph_relationships", 0))
                 else:
+                    answer_header.empty()
                     st.markdown(f"""
                     <div class="error-msg">
-                        ❌ <strong>Error:</strong> {result.get('error', 'Unknown error')}
+                        ❌ <strong>Error:</strong> {result.get('error') or query_result.get('answer', 'Unknown error')}
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -260,6 +328,21 @@ def render_chat_section():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_export(user_id: str, version: int) -> tuple[bytes, dict]:
+    """Serialized graph export and its statistics, cached per graph version"""
+    export_data = _graph_visualizer().export_graph_data(user_id)
+    if not export_data["success"]:
+        # Raised (not returned) so failures are never cached
+        raise RuntimeError(export_data.get("error", "Unknown error"))
+    
+    json_bytes = orjson.dumps(
+        export_data,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+        default=str
+    )
+    return json_bytes, export_data["statistics"]
+
 def render_visualization_section():
     """Render knowledge graph visualization section"""
     st.markdown('<div class="viz-section">', unsafe_allow_html=True)
@@ -273,29 +356,28 @@ def render_visualization_section():
 
         if st.button("📊 Export Graph Data"):
             try:
-                export_data = graph_visualizer.export_graph_data(st.session_state.user_id)
-                if export_data["success"]:
-                    # Convert to JSON string for download
-                    import json
-                    json_data = json.dumps(export_data, indent=2, default=str)
-                    
-                    st.download_button(
-                        label="💾 Download JSON",
-                        data=json_data,
-                        file_name=f"studymate_graph_{st.session_state.user_id}.json",
-                        mime="application/json"
-                    )
-                    
-                    st.success(f"✅ Export ready! {export_data['statistics']['nodes']} nodes, {export_data['statistics']['edges']} relationships")
-                else:
-                    st.error(f"Export failed: {export_data.get('error', 'Unknown error')}")
+                json_data, statistics = _cached_export(
+                    st.session_state.user_id,
+                    st.session_state.graph_version
+                )
+                
+                st.download_button(
+                    label="💾 Download JSON",
+                    data=json_data,
+                    file_name=f"studymate_graph_{st.session_state.user_id}.json",
+                    mime="application/json"
+                )
+                
+                st.success(f"✅ Export ready! {statistics['nodes']} nodes, {statistics['edges']} relationships")
+            except RuntimeError as e:
+                st.error(f"Export failed: {str(e)}")
             except Exception as e:
                 st.error(f"Export error: {str(e)}")
     
     if visualize_button:
         with st.spinner("Generating knowledge graph..."):
             try:
-                graph_visualizer.render_graph_in_streamlit(st.session_state.user_id)
+                _graph_visualizer().render_graph_in_streamlit(st.session_state.user_id)
             except Exception as e:
                 st.markdown(f"""
                 <div class="error-msg">
@@ -310,10 +392,27 @@ def render_sidebar():
     with st.sidebar:
         st.markdown("## 🔧 System Status")
         
-        # Check dependencies
-        issues = check_dependencies()
+        # Show the last known status; only this (script) thread writes it
+        dep_status = st.session_state.dep_status
+        refresh = dep_status.get("refresh")
+        if refresh is not None and refresh.done():
+            dep_status["refresh"] = None
+            if refresh.exception() is None:
+                dep_status["issues"] = refresh.result()
+            elif dep_status["issues"] is None:
+                dep_status["issues"] = [f"❌ System check failed: {refresh.exception()}"]
+        
+        # Probes always run in the background, the first one included
+        stale = time.time() - dep_status["ts"] > DEPENDENCY_REFRESH_SECONDS
+        if (dep_status["issues"] is None or stale) and dep_status.get("refresh") is None:
+            dep_status["ts"] = time.time()
+            dep_status["refresh"] = _start_dependency_refresh()
+        
+        issues = dep_status["issues"]
         
-        if not issues:
+        if issues is None:
+            _pending_dependency_status()
+        elif not issues:
             st.markdown("✅ All systems operational")
         else:
             for issue in issues:
@@ -2,12 +2,32 @@
 OpenRouter LLM configuration and client setup
 """
 import os
+import functools
+import httpx
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Shared HTTP client so sockets are pooled across LLM calls
+_http_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+)
+
+@functools.lru_cache(maxsize=4)
+def _build_llm(model, api_key, base_url, temperature, max_tokens):
+    """Build a ChatOpenAI client once per distinct configuration"""
+    return ChatOpenAI(
+        model=model,
+        openai_api_key=api_key,
+        openai_api_base=base_url,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        http_client=_http_client
+    )
+
 class LLMConfig:
     def __init__(self):
         self.api_key = os.getenv("OPENROUTER_API_KEY")
@@ -19,12 +39,12 @@ class LLMConfig:
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY not found in environment variables")
             
-        return ChatOpenAI(
-            model=self.model,
-            openai_api_key=self.api_key,
-            openai_api_base=self.base_url,
-            temperature=0.1,  # Lower temperature for consistent extraction
-            max_tokens=2000
+        return _build_llm(
+            self.model,
+            self.api_key,
+            self.base_url,
+            0.1,  # Lower temperature for consistent extraction
+            2000
         )
         
     def test_connection(self):
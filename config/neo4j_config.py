@@ -2,6 +2,7 @@
 Neo4j configuration and connection management
 """
 import os
+import atexit
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
 
@@ -13,20 +14,34 @@ class Neo4jConfig:
         self.uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
         self.username = os.getenv("NEO4J_USERNAME", "neo4j") 
         self.password = os.getenv("NEO4J_PASSWORD", "neo4j")
+        self.database = os.getenv("NEO4J_DATABASE", "neo4j")
+        self.max_pool_size = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+        self._driver = None
+        
+        # Close the shared driver when the process exits
+        atexit.register(self.close)
         
     def get_driver(self):
-        """Get Neo4j driver instance"""
-        return GraphDatabase.driver(
-            self.uri, 
-            auth=(self.username, self.password)
-        )
+        """Get the shared Neo4j driver instance (created on first use)"""
+        if self._driver is None:
+            self._driver = GraphDatabase.driver(
+                self.uri, 
+                auth=(self.username, self.password),
+                max_connection_pool_size=self.max_pool_size,
+                connection_acquisition_timeout=30
+            )
+        return self._driver
+        
+    def close(self):
+        """Close the shared Neo4j driver"""
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
         
     def test_connection(self):
         """Test Neo4j connection"""
         try:
-            driver = self.get_driver()
-            driver.verify_connectivity()
-            driver.close()
+            self.get_driver().verify_connectivity()
             return True
         except Exception as e:
             print(f"Neo4j connection failed: {e}")
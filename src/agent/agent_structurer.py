@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+
+
 def build_framework_structure(framework_name, components):
     structure = {
         "type": "framework_overview",
@@ -13,21 +16,29 @@ def build_framework_structure(framework_name, components):
 
     return structure
 
-def build_structured_context(graph_context, vector_results):
-    sections = {}
+@dataclass(slots=True)
+class StructuredContext:
+    concepts: list[str]
+    relationships: list[str]
+    documents: list[str]
+
 
-    sections["concepts"] = [
-        e["name"] for e in graph_context.get("entities", [])
-    ]
+# Vector chunks are trimmed to this many characters in the answer context
+MAX_DOCUMENT_CHARS = 500
 
-    sections["relationships"] = [
-        f"{r['from']} {r['type']} {r['to']}"
-        for r in graph_context.get("relationships", [])
-    ]
 
-    sections["documents"] = [
-        v["chunk"]["text"][:500]
-        for v in vector_results
-    ]
+def build_structured_context(graph_context, vector_results) -> StructuredContext:
+    documents = []
+    for v in vector_results:
+        text = v["chunk"]["text"]
+        # Only slice (and copy) texts that are actually too long
+        documents.append(text if len(text) <= MAX_DOCUMENT_CHARS else text[:MAX_DOCUMENT_CHARS])
 
-    return sections
\ No newline at end of file
+    return StructuredContext(
+        concepts=[e["name"] for e in graph_context.get("entities", [])],
+        relationships=[
+            f"{r['from']} {r['type']} {r['to']}"
+            for r in graph_context.get("relationships", [])
+        ],
+        documents=documents
+    )
@@ -1,32 +1,34 @@
-def generate_answer(question, structured_context):
-    context_text = ""
-
-    if structured_context["concepts"]:
-        context_text += "Concepts:\n" + ", ".join(structured_context["concepts"]) + "\n\n"
-
-    if structured_context["relationships"]:
-        context_text += "Relationships:\n" + "\n".join(structured_context["relationships"]) + "\n\n"
+from src.agent.intent_classifier import INTENT_LINE_INSTRUCTION
+
+# Static prefix kept identical across calls so providers can cache it;
+# only the context and question are filled in per request
+_PROMPT_TEMPLATE = (
+    "You are a university tutor.\n\n"
+    + INTENT_LINE_INSTRUCTION + "\n\n"
+    "Answer using this structure:\n"
+    "1. Definition\n"
+    "2. Objectives\n"
+    "3. Components / Tools\n"
+    "4. Integration Levels\n"
+    "5. Benefits\n"
+    "6. Example\n\n"
+    "ONLY use the context below.\n\n"
+    "Context:\n"
+    "{ctx}\n\n"
+    "Question: {q}\n"
+)
 
-    if structured_context["documents"]:
-        context_text += "Documents:\n" + "\n".join(structured_context["documents"])
 
-    prompt = f"""
-    You are a university tutor.
-
-    Answer using this structure:
-    1. Definition
-    2. Objectives
-    3. Components / Tools
-    4. Integration Levels
-    5. Benefits
-    6. Example
+def generate_answer(question, structured_context):
+    context_text = ""
 
-    ONLY use the context below.
+    if structured_context.concepts:
+        context_text += "Concepts:\n" + ", ".join(structured_context.concepts) + "\n\n"
 
-    Context:
-    {context_text}
+    if structured_context.relationships:
+        context_text += "Relationships:\n" + "\n".join(structured_context.relationships) + "\n\n"
 
-    Question: {question}
-    """
+    if structured_context.documents:
+        context_text += "Documents:\n" + "\n".join(structured_context.documents)
 
-    return prompt
\ No newline at end of file
+    return _PROMPT_TEMPLATE.format(ctx=context_text, q=question)
@@ -1,14 +1,30 @@
+import re
+from typing import Iterable, Iterator, Optional
+
+INTENT_LABELS = (
+    "framework_overview",
+    "concept_explanation",
+    "comparison",
+    "step_by_step",
+    "example_case",
+    "ethical_reasoning",
+)
+
+# Prepended to answer prompts so the intent comes back with the answer
+INTENT_LINE_INSTRUCTION = (
+    "Line 1: ONLY 'Intent: <label>', where <label> is the academic intent of the question, one of: "
+    + ", ".join(INTENT_LABELS) + ".\n"
+    "Line 2 onwards: the answer."
+)
+
+
 def classify_intent(llm, question: str) -> str:
+    labels = "\n".join(f"- {label}" for label in INTENT_LABELS)
     prompt = f"""
 Classify the academic intent of this question.
 
 Choose ONE:
-- framework_overview
-- concept_explanation
-- comparison
-- step_by_step
-- example_case
-- ethical_reasoning
+{labels}
 
 Question:
 "{question}"
@@ -16,4 +32,49 @@ Question:
 Return ONLY the label.
 """
     response = llm.invoke(prompt)
-    return response.content.strip().lower()
\ No newline at end of file
+    return response.content.strip().lower()
+
+
+# Line 1 of the answer, exactly: "Intent: <label>" (prefix and bold markers optional)
+_INTENT_LINE_RE = re.compile(
+    r"^\s*(?:intent:\s*)?\**(" + "|".join(INTENT_LABELS) + r")\**\s*$",
+    re.IGNORECASE
+)
+
+
+def _parse_intent_label(line: str) -> Optional[str]:
+    match = _INTENT_LINE_RE.match(line)
+    return match.group(1).lower() if match else None
+
+
+def split_intent_line(content: str) -> tuple[Optional[str], str]:
+    """Split an answer produced with INTENT_LINE_INSTRUCTION into (intent, answer)"""
+    first_line, _, rest = content.strip().partition("\n")
+    label = _parse_intent_label(first_line)
+
+    if label is not None:
+        return label, rest.strip()
+    return None, content.strip()
+
+
+# Longest line that can still be an intent line; past this the stream is let through
+_MAX_INTENT_LINE_CHARS = 64
+
+
+def strip_intent_line(tokens: Iterable[str]) -> Iterator[str]:
+    """Streaming counterpart of split_intent_line: yield the answer without the intent line"""
+    tokens = iter(tokens)
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        # Only line 1 is held back, and only until it ends
+        if "\n" in buffer.lstrip() or len(buffer) > _MAX_INTENT_LINE_CHARS:
+            break
+
+    first_line, newline, rest = buffer.lstrip().partition("\n")
+    if _parse_intent_label(first_line) is not None:
+        buffer = rest.lstrip()
+
+    if buffer:
+        yield buffer
+    yield from tokens
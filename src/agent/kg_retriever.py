@@ -1,14 +1,51 @@
+import re
+import threading
+
+from cachetools import TTLCache
+
+# Questions mentioning any of these are routed to the Promotion Mix framework
+_FRAMEWORK_KW_RE = re.compile(r'promotion|marketing communication|communication', re.IGNORECASE)
+
+
 class KGRetriever:
+    # Framework lookups keyed by (query, framework name). The framework queries
+    # match entities of every user, so entries are not per user and any
+    # successful upload clears them all (see invalidate)
+    _lookup_cache = TTLCache(maxsize=256, ttl=600)
+    _lookup_cache_lock = threading.Lock()
+
     def __init__(self, neo4j_client):
         self.neo4j = neo4j_client
 
+    @classmethod
+    def invalidate(cls):
+        """Drop cached framework lookups after the graph changed"""
+        with cls._lookup_cache_lock:
+            cls._lookup_cache.clear()
+
+    def _cached_lookup(self, key: tuple, fetch):
+        with self._lookup_cache_lock:
+            if key in self._lookup_cache:
+                return self._lookup_cache[key]
+
+        result = fetch()
+
+        with self._lookup_cache_lock:
+            self._lookup_cache[key] = result
+        return result
+
     def get_framework_by_question(self, question: str):
         # Simple heuristic (good enough for now)
-        keywords = ["promotion", "marketing communication", "communication"]
-        for kw in keywords:
-            if kw in question.lower():
-                return self.neo4j.get_framework_by_name("Promotion Mix")
+        if _FRAMEWORK_KW_RE.search(question):
+            # Every matching question maps to the same lookup, so cache that, not the question
+            return self._cached_lookup(
+                ("framework", "Promotion Mix"),
+                lambda: self.neo4j.get_framework_by_name("Promotion Mix")
+            )
         return None
 
     def get_framework_components(self, framework_name: str):
-        return self.neo4j.get_components_of_framework(framework_name)
\ No newline at end of file
+        return self._cached_lookup(
+            ("components", framework_name),
+            lambda: self.neo4j.get_components_of_framework(framework_name)
+        )
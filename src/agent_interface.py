@@ -2,24 +2,79 @@
 Public Agent Interface for StudyMate
 """
 
-from src.agent_runner import run_agent
+import threading
+from typing import IO, Generator
+from cachetools import TTLCache
+
+from src.agent_runner import run_agent, stream_agent_answer
 
 
 class StudyMateAgent:
-    def upload(self, user_id: str, file_data: bytes, filename: str) -> dict:
-        return run_agent({
+    # Successful answers keyed by (user_id, normalized question)
+    _answer_cache = TTLCache(maxsize=1024, ttl=900)
+    _answer_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(user_id: str, question: str) -> tuple:
+        return user_id, " ".join(question.lower().split())
+
+    @staticmethod
+    def _is_answered(result: dict) -> bool:
+        """Only answers built from the user's materials are cached"""
+        return bool(result.get("success") and result.get("query_result", {}).get("success"))
+
+    def _invalidate_user(self, user_id: str):
+        """Drop cached answers for a user whose materials changed"""
+        with self._answer_cache_lock:
+            for key in [k for k in self._answer_cache if k[0] == user_id]:
+                self._answer_cache.pop(key, None)
+
+    def upload(self, user_id: str, file_obj: IO[bytes], filename: str) -> dict:
+        result = run_agent({
             "action": "upload",
             "user_id": user_id,
-            "file_data": file_data,
+            "file_obj": file_obj,
             "filename": filename
         })
+        if result.get("success"):
+            self._invalidate_user(user_id)
+        return result
 
     def ask(self, user_id: str, question: str) -> dict:
-        return run_agent({
+        key = self._cache_key(user_id, question)
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = run_agent({
+            "action": "query",
+            "user_id": user_id,
+            "question": question
+        })
+        if self._is_answered(result):
+            with self._answer_cache_lock:
+                self._answer_cache[key] = result
+        return result
+
+    def ask_stream(self, user_id: str, question: str) -> Generator[str, None, dict]:
+        """Like ask, but yields the answer text as it is generated and returns ask's result"""
+        key = self._cache_key(user_id, question)
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get(key)
+        if cached is not None:
+            yield cached["query_result"]["answer"]
+            return cached
+
+        result = yield from stream_agent_answer({
             "action": "query",
             "user_id": user_id,
             "question": question
         })
+        if self._is_answered(result):
+            with self._answer_cache_lock:
+                self._answer_cache[key] = result
+        return result
 
     def visualize(self, user_id: str) -> dict:
         return run_agent({
@@ -3,21 +3,22 @@ LangGraph Workflow Runner for BinusBrain
 Owns orchestration, state, routing
 """
 
-from typing import TypedDict, Annotated, Optional
+from typing import IO, TypedDict, Annotated, Optional, Generator
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage
 
-from src.upload_handler import upload_handler
+from src.upload_handler import get_upload_handler
 from src.kg_extractor import kg_extractor
 from src.query_engine import query_engine
 from src.neo4j_client import neo4j_client
+from src.agent.kg_retriever import KGRetriever
 
 
 class AgentState(TypedDict):
     user_id: str
     action: str
 
-    file_data: Optional[bytes]
+    file_obj: Optional[IO[bytes]]
     filename: Optional[str]
     extracted_text: Optional[str]
     file_type: Optional[str]
@@ -77,17 +78,19 @@ class BinusBrainWorkflow:
         return state.get("action", "error")
 
     def _upload(self, state: AgentState) -> AgentState:
-        extracted_text, file_type = upload_handler.process_upload(
-            state["file_data"],
+        extracted_text, file_type = get_upload_handler().process_upload(
+            state["file_obj"],
             state["filename"],
             state["user_id"]
         )
 
         if not extracted_text:
-            return {**state, "error": "Text extraction failed"}
+            return {**state, "file_obj": None, "error": "Text extraction failed"}
 
+        # The file is not needed past text extraction; don't carry it through the graph
         return {
             **state,
+            "file_obj": None,
             "extracted_text": extracted_text,
             "file_type": file_type
         }
@@ -98,8 +101,13 @@ class BinusBrainWorkflow:
             state["user_id"]
         )
 
+        if result.get("success"):
+            # Framework lookups span every user's graph, so any upload can change them
+            KGRetriever.invalidate()
+
         return {
             **state,
+            "extracted_text": None,
             "processing_result": result,
             "success": True
         }
@@ -125,4 +133,20 @@ _workflow = BinusBrainWorkflow()
 def run_agent(state: dict) -> dict:
     if "messages" not in state:
         state["messages"] = []
-    return _workflow.workflow.invoke(state)
\ No newline at end of file
+    return _workflow.workflow.invoke(state)
+
+
+def stream_agent_answer(state: dict) -> Generator[str, None, dict]:
+    """
+    Streaming variant of the query action.
+    The compiled graph only returns the final state, so this calls the
+    query engine directly and yields answer text as it is generated;
+    it returns the same final state run_agent would.
+    """
+    query_result = yield from query_engine.stream_answer(state["question"], state["user_id"])
+    return {
+        **state,
+        "messages": state.get("messages", []),
+        "query_result": query_result,
+        "success": True
+    }
@@ -2,6 +2,9 @@ import re
 from typing import List
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+# Numbered headings (e.g. 14.1, 2.3.1)
+_NUMBERED_HEADING = re.compile(r'^\d+(?:\.\d+)*\s+')
+
 def recursive_chunk_text(text: str, chunk_size: int = 2000, chunk_overlap: int = 200) -> list[str]:
     """
     Recursively splits text into balanced chunks with overlap, prioritizing semantic boundaries.
@@ -37,7 +40,7 @@ def is_heading(line: str) -> bool:
         return True
 
     # Numbered headings (e.g. 14.1, 2.3.1)
-    if re.match(r'^\d+(\.\d+)*\s+', line):
+    if _NUMBERED_HEADING.match(line):
         return True
 
     # Title Case headings
@@ -52,18 +55,18 @@ def break_at_sentence_boundary(text: str, max_len: int) -> tuple[str, str]:
     if len(text) <= max_len:
         return text, ""
     
-    # Try to find sentence ending near max_len
-    search_start = max_len - 200
-    search_end = max_len + 200
+    # Try to find the last sentence ending within 200 chars of max_len
+    search_start = max(max_len - 200, 0) + 1
+    search_end = min(max_len + 200, len(text) - 1) + 1
     
-    for i in range(min(search_end, len(text)), max(search_start, 0), -1):
-        if text[i] in '.!?':
-            return text[:i+1].strip(), text[i+1:].strip()
+    i = max(text.rfind(p, search_start, search_end) for p in '.!?')
+    if i != -1:
+        return text[:i+1].strip(), text[i+1:].strip()
     
     # If no sentence boundary found, break at word boundary
-    for i in range(max_len, max(0, max_len - 100), -1):
-        if text[i] == ' ':
-            return text[:i].strip(), text[i:].strip()
+    i = text.rfind(' ', max(0, max_len - 100) + 1, max_len + 1)
+    if i != -1:
+        return text[:i].strip(), text[i:].strip()
     
     # Last resort: break at max_len
     return text[:max_len].strip(), text[max_len:].strip()
@@ -73,7 +76,10 @@ def semantic_chunk(text: str, max_chars: int = 6000) -> List[str]:
     lines = text.split('\n')
     chunks = []
 
-    current_chunk = ""
+    # The current chunk is built as a list of pieces and joined on flush;
+    # current_len tracks the length of the joined chunk
+    current_buf = []
+    current_len = 0
     current_heading = ""
     pending_line = ""
 
@@ -84,11 +90,12 @@ def semantic_chunk(text: str, max_chars: int = 6000) -> List[str]:
 
         if is_heading(line):
             # Finish current chunk before starting new one
-            if current_chunk:
-                chunks.append(current_chunk.strip())
+            if current_len:
+                chunks.append("".join(current_buf).strip())
             
             current_heading = line
-            current_chunk = f"{line}\n"
+            current_buf = [line, "\n"]
+            current_len = len(line) + 1
             pending_line = ""
         else:
             # Process pending line first (from previous long line)
@@ -97,52 +104,55 @@ def semantic_chunk(text: str, max_chars: int = 6000) -> List[str]:
                 pending_line = ""
             
             # Check if adding this line would exceed max_chars
-            potential_chunk = current_chunk + line + " "
-            
-            if len(potential_chunk) > max_chars and current_chunk:
+            if current_len + len(line) + 1 > max_chars and current_len:
                 # Finish current chunk
-                chunks.append(current_chunk.strip())
-                current_chunk = current_heading + "\n"
+                chunks.append("".join(current_buf).strip())
+                current_buf = [current_heading, "\n"]
+                current_len = len(current_heading) + 1
             
             # Handle very long lines
             if len(line) > max_chars:
                 # Break the long line at sentence boundary
-                break_point = max_chars - len(current_chunk) - 100
-                if break_point > 0:
-                    first_part, remaining_part = break_at_sentence_boundary(line, break_point)
-                    current_chunk += first_part + " "
-                    chunks.append(current_chunk.strip())
-                    current_chunk = current_heading + "\n"
-                    pending_line = remaining_part
-                else:
+                break_point = max_chars - current_len - 100
+                if break_point <= 0:
                     # Line is too long even for empty chunk, just break it
-                    first_part, remaining_part = break_at_sentence_boundary(line, max_chars)
-                    current_chunk += first_part + " "
-                    chunks.append(current_chunk.strip())
-                    current_chunk = current_heading + "\n"
-                    pending_line = remaining_part
+                    break_point = max_chars
+                first_part, remaining_part = break_at_sentence_boundary(line, break_point)
+                current_buf.append(first_part)
+                chunks.append("".join(current_buf).strip())
+                current_buf = [current_heading, "\n"]
+                current_len = len(current_heading) + 1
+                pending_line = remaining_part
             else:
                 # Normal case: add line to current chunk
-                current_chunk += line + " "
+                current_buf.append(line)
+                current_buf.append(" ")
+                current_len += len(line) + 1
                 
                 # If chunk is getting full, check if we should break here
-                if len(current_chunk) >= max_chars - 500:  # Leave some buffer
-                    # Look for a good break point in the current chunk
-                    break_point = len(current_chunk)
-                    for i in range(len(current_chunk) - 100, len(current_chunk)):
-                        if current_chunk[i] in '.!?':
-                            break_point = i + 1
-                            break
+                if current_len >= max_chars - min(500, max_chars // 4):  # Leave some buffer
+                    current_chunk = "".join(current_buf)
+                    current_buf = [current_chunk]
+
+                    # Look for a good break point in the last 100 chars of the chunk,
+                    # never inside the heading line that starts it
+                    window_start = max(current_len - 100, len(current_heading) + 1)
+                    hits = [i for i in (current_chunk.find(p, window_start) for p in '.!?') if i != -1]
+                    break_point = min(hits) + 1 if hits else current_len
                     
-                    if break_point < len(current_chunk):
+                    if break_point < current_len:
                         chunks.append(current_chunk[:break_point].strip())
-                        current_chunk = current_heading + "\n" + current_chunk[break_point:].strip()
-                        if not current_chunk.strip() == current_heading:
-                            current_chunk += " "
+                        remainder = current_chunk[break_point:].strip()
+                        current_buf = [current_heading, "\n", remainder]
+                        current_len = len(current_heading) + 1 + len(remainder)
+                        if remainder:
+                            current_buf.append(" ")
+                            current_len += 1
 
     # Add final chunk
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    final_chunk = "".join(current_buf).strip()
+    if final_chunk:
+        chunks.append(final_chunk)
     
     # Handle any pending line
     if pending_line:
@@ -1,12 +1,77 @@
 """
 Knowledge Graph Visualization using PyVis
 """
+import re
 import json
-from typing import Dict, Any, List
+import functools
+from collections import Counter
+from typing import Dict, Any, List, Optional
+import networkx as nx
 from pyvis.network import Network
 import streamlit as st
 from src.neo4j_client import neo4j_client
 
+# Node positions are computed server-side and scaled to canvas pixels
+LAYOUT_SCALE = 1000
+LAYOUT_ITERATIONS = 50
+
+# Above this many nodes edges are hidden while dragging
+LARGE_GRAPH_NODES = 300
+LARGE_GRAPH_OPTIONS = {
+    "physics": {"enabled": False},
+    "interaction": {"hideEdgesOnDrag": True},
+    "layout": {"improvedLayout": False},
+}
+
+# Placeholders for the only parts of the PyVis page that change per graph
+_TEMPLATE_SLOT_RE = re.compile(r"__GRAPH_(NODES|EDGES|OPTIONS)__")
+_EMPTY_DATASET = "new vis.DataSet([])"
+
+def _new_network() -> Network:
+    """PyVis network with the canvas settings used for every user graph"""
+    net = Network(height="600px", width="100%")
+    net.toggle_physics(False)
+    return net
+
+@functools.lru_cache(maxsize=1)
+def _network_template() -> Optional[str]:
+    """
+    Render the PyVis page once for an empty network and turn its nodes,
+    edges and options into placeholders; None if the page doesn't have the
+    expected shape (callers then fall back to generate_html)
+    """
+    net = _new_network()
+    html = net.generate_html()
+    options = net.get_network_data()[5]
+    if html.count(_EMPTY_DATASET) != 2 or html.count(options) != 1:
+        return None
+    html = html.replace(_EMPTY_DATASET, "new vis.DataSet(__GRAPH_NODES__)", 1)
+    html = html.replace(_EMPTY_DATASET, "new vis.DataSet(__GRAPH_EDGES__)", 1)
+    return html.replace(options, "__GRAPH_OPTIONS__", 1)
+
+def _html_safe_json(data) -> str:
+    """json.dumps escaped for a <script> block, as Jinja's tojson does"""
+    return (json.dumps(data, sort_keys=True)
+            .replace("<", "\\u003c").replace(">", "\\u003e")
+            .replace("&", "\\u0026").replace("'", "\\u0027"))
+
+class _GraphRenderError(Exception):
+    """The graph couldn't be turned into a network page (message is shown to the user)"""
+
+class _EmptyGraphError(Exception):
+    """The user has no graph data yet"""
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_graph(user_id: str, signature: tuple):
+    """
+    Graph data and rendered HTML for a user; signature changes whenever the graph does.
+    Empty graphs and failures raise, so only successful renders are cached.
+    """
+    graph_data = neo4j_client.get_user_graph_data(user_id)
+    if not graph_data['nodes']:
+        raise _EmptyGraphError()
+    return graph_data, graph_visualizer._build_network_html(graph_data, user_id)
+
 class GraphVisualizer:
     def __init__(self):
         self.colors = {
@@ -34,123 +99,154 @@ class GraphVisualizer:
             HTML string for Streamlit rendering
         """
         try:
-            # Validate input data
-            if not graph_data or not isinstance(graph_data, dict):
-                return self._create_error_html("Invalid graph data provided")
-            
-            # Get nodes and edges safely
-            nodes = graph_data.get('nodes', []) or []
-            edges = graph_data.get('edges', []) or []
-            
-            if not nodes:
-                return self._create_error_html("No nodes found in graph data")
-            
-            # Create PyVis network with basic configuration only
-            net = Network(height="600px", width="100%")
-            
-            # Add nodes with safe handling
-            node_ids = set()
-            nodes_added = 0
-            
-            for node in nodes:
-                try:
-                    if not isinstance(node, dict):
-                        continue
-                        
-                    node_id = str(node.get('id', '')).strip()
-                    if not node_id or node_id in node_ids:
-                        continue
-                    node_ids.add(node_id)
-                    
-                    node_label = str(node.get('label', node_id)).strip()
-                    node_type = str(node.get('type', 'concept')).strip()
-                    
-                    # Ensure valid types for PyVis
-                    if not node_label:
-                        node_label = node_id
-                    
-                    # Choose color based on entity type (use string color)
-                    color = self.colors.get(node_type, self.default_color)
-                    
-                    # Calculate node size based on connections
-                    node_size = self._calculate_node_size(node_id, edges)
-                    
-                    # Add node with minimal configuration to avoid PyVis errors
-                    net.add_node(
-                        node_id,
-                        label=node_label[:50] if len(node_label) > 50 else node_label,
-                        color=color,
-                        size=max(10, min(30, node_size))
-                    )
-                    nodes_added += 1
-                    
-                except Exception as e:
-                    print(f"Error adding node {node}: {e}")
+            return self._build_network_html(graph_data, user_id)
+        except _GraphRenderError as e:
+            return self._create_error_html(str(e))
+        except Exception as e:
+            print(f"Error creating network graph: {e}")
+            import traceback
+            traceback.print_exc()
+            return self._create_error_html(f"Graph creation failed: {str(e)}")
+    
+    def _build_network_html(self, graph_data: Dict[str, Any], user_id: str) -> str:
+        """Network page for graph data; raises _GraphRenderError instead of returning error HTML"""
+        # Validate input data
+        if not graph_data or not isinstance(graph_data, dict):
+            raise _GraphRenderError("Invalid graph data provided")
+        
+        # Get nodes and edges safely
+        nodes = graph_data.get('nodes', []) or []
+        edges = graph_data.get('edges', []) or []
+        
+        if not nodes:
+            raise _GraphRenderError("No nodes found in graph data")
+        
+        # Connection count per node, computed once for all node sizes
+        degree = self._node_degrees(edges)
+        
+        # Validate nodes into parallel lists before touching PyVis
+        node_ids = set()
+        node_list, labels, colors, sizes = [], [], [], []
+        
+        for node in nodes:
+            try:
+                if not isinstance(node, dict):
                     continue
-            
-            # Add edges with safe handling
-            edges_added = 0
-            for edge in edges:
-                try:
-                    if not isinstance(edge, dict):
-                        continue
-                        
-                    from_node = str(edge.get('from', '')).strip()
-                    to_node = str(edge.get('to', '')).strip()
-                    edge_label = str(edge.get('label', 'relates_to')).strip()
                     
-                    # Only add edge if both nodes exist
-                    if from_node in node_ids and to_node in node_ids and from_node != to_node:
-                        # Add edge with minimal configuration
-                        net.add_edge(
-                            from_node,
-                            to_node
-                        )
-                        edges_added += 1
-                        
-                except Exception as e:
-                    print(f"Error adding edge {edge}: {e}")
+                node_id = str(node.get('id', '')).strip()
+                if not node_id or node_id in node_ids:
                     continue
-            
-            if nodes_added == 0:
-                return self._create_error_html("No valid nodes could be added to the graph")
-            
-            # Set very basic options to avoid PyVis configuration issues
+                node_ids.add(node_id)
+                
+                node_label = str(node.get('label', node_id)).strip()
+                node_type = str(node.get('type', 'concept')).strip()
+                
+                # Ensure valid types for PyVis
+                if not node_label:
+                    node_label = node_id
+                
+                node_list.append(node_id)
+                labels.append(node_label[:50] if len(node_label) > 50 else node_label)
+                # Choose color based on entity type (use string color)
+                colors.append(self.colors.get(node_type, self.default_color))
+                # Node size based on connections (base size + connection bonus)
+                sizes.append(max(10, min(30, 15 + degree[node_id] * 3)))
+                
+            except Exception as e:
+                print(f"Error adding node {node}: {e}")
+                continue
+        
+        # Validate edges; only keep edges whose endpoints both exist
+        edge_list = []
+        for edge in edges:
             try:
-                net.set_options({"physics": {"enabled": True}})
+                if not isinstance(edge, dict):
+                    continue
+                    
+                from_node = str(edge.get('from', '')).strip()
+                to_node = str(edge.get('to', '')).strip()
+                
+                if from_node in node_ids and to_node in node_ids and from_node != to_node:
+                    edge_list.append((from_node, to_node))
+                    
             except Exception as e:
-                print(f"Warning: Could not set options: {e}")
-                # Continue without custom options
-            
-            # Generate HTML
+                print(f"Error adding edge {edge}: {e}")
+                continue
+        
+        nodes_added = len(node_list)
+        edges_added = len(edge_list)
+        
+        if nodes_added == 0:
+            raise _GraphRenderError("No valid nodes could be added to the graph")
+        
+        # Static layout computed here so the browser doesn't run physics
+        positions = self._compute_layout(node_list, edge_list)
+        
+        # Create PyVis network with basic configuration only
+        net = _new_network()
+        
+        # Nodes are added one by one: Network.add_nodes coerces number-like
+        # ids to int and then loses their label/color/size
+        for node_id, label, color, size in zip(node_list, labels, colors, sizes):
+            x, y = positions[node_id]
+            net.add_node(
+                node_id,
+                label=label,
+                color=color,
+                size=size,
+                x=float(x) * LAYOUT_SCALE,
+                y=float(y) * LAYOUT_SCALE,
+                physics=False,
+                fixed=True
+            )
+        net.add_edges(edge_list)
+        
+        # Interaction tweaks that keep big graphs responsive
+        if nodes_added > LARGE_GRAPH_NODES:
             try:
-                html_string = net.generate_html()
+                net.set_options(json.dumps(LARGE_GRAPH_OPTIONS))
             except Exception as e:
-                return self._create_error_html(f"Failed to generate HTML: {str(e)}")
-            
-            # Add custom styling and title
-            styled_html = f"""
-            <div style="background-color: #2E2E2E; padding: 20px; border-radius: 10px;">
-                <h3 style="color: white; text-align: center; margin-bottom: 10px;">
-                    🕸️ Knowledge Graph for User: {user_id}
-                </h3>
-                <div style="background-color: #1E1E1E; padding: 10px; border-radius: 5px; margin-bottom: 15px;">
-                    <p style="color: #CCCCCC; margin: 0; font-size: 14px;">
-                        📊 Nodes: {nodes_added} | 
-                        🔗 Relationships: {edges_added}
-                    </p>
-                </div>
-                {html_string}
-            </div>
-            """
-            
-            return styled_html
-            
+                print(f"Warning: Could not set options: {e}")
+                # Continue with default options
+        
+        # Generate HTML (fill the pre-rendered page instead of re-running Jinja)
+        try:
+            html_string = self._render_network_html(net)
         except Exception as e:
-            print(f"Error creating network graph: {e}")
-            import traceback
-            traceback.print_exc()
-            return self._create_error_html(f"Graph creation failed: {str(e)}")
+            raise _GraphRenderError(f"Failed to generate HTML: {str(e)}")
+        
+        # Add custom styling and title
+        styled_html = f"""
+        <div style="background-color: #2E2E2E; padding: 20px; border-radius: 10px;">
+            <h3 style="color: white; text-align: center; margin-bottom: 10px;">
+                🕸️ Knowledge Graph for User: {user_id}
+            </h3>
+            <div style="background-color: #1E1E1E; padding: 10px; border-radius: 5px; margin-bottom: 15px;">
+                <p style="color: #CCCCCC; margin: 0; font-size: 14px;">
+                    📊 Nodes: {nodes_added} | 
+                    🔗 Relationships: {edges_added}
+                </p>
+            </div>
+            {html_string}
+        </div>
+        """
+        
+        return styled_html
+    
+    def _render_network_html(self, net: Network) -> str:
+        """Page HTML for a built network, from the cached template when available"""
+        template = _network_template()
+        if template is None:
+            return net.generate_html()
+        
+        nodes, edges, _, _, _, options = net.get_network_data()
+        values = {
+            "NODES": _html_safe_json(nodes),
+            "EDGES": _html_safe_json(edges),
+            "OPTIONS": options,
+        }
+        # Single pass, so placeholder-like text inside labels is left alone
+        return _TEMPLATE_SLOT_RE.sub(lambda m: values[m.group(1)], template)
     
     def _create_error_html(self, error_message: str) -> str:
         """Create error HTML display"""
@@ -162,16 +258,27 @@ class GraphVisualizer:
         </div>
         """
     
-    def _calculate_node_size(self, node_id: str, edges: List[Dict[str, Any]]) -> int:
-        """Calculate node size based on number of connections"""
-        connections = 0
+    def _compute_layout(self, node_ids: List[str], edges: List[tuple]) -> Dict[str, Any]:
+        """Spring layout positions for the nodes (seeded so the graph doesn't jump between renders)"""
+        graph = nx.Graph()
+        graph.add_nodes_from(node_ids)
+        graph.add_edges_from(edges)
+        return nx.spring_layout(graph, seed=42, iterations=LAYOUT_ITERATIONS)
+    
+    def _node_degrees(self, edges: List[Dict[str, Any]]) -> Counter:
+        """Count connections per node in a single pass over the edges"""
+        degree = Counter()
         
         for edge in edges:
-            if edge['from'] == node_id or edge['to'] == node_id:
-                connections += 1
+            if not isinstance(edge, dict):
+                continue
+            from_node, to_node = edge.get('from'), edge.get('to')
+            degree[from_node] += 1
+            # A self-loop is one connection, not two
+            if to_node != from_node:
+                degree[to_node] += 1
         
-        # Base size + connection bonus
-        return max(15, min(40, 15 + connections * 3))
+        return degree
     
     def render_graph_in_streamlit(self, user_id: str):
         """
@@ -181,15 +288,16 @@ class GraphVisualizer:
             user_id: User identifier
         """
         try:
-            # Get graph data from Neo4j
-            graph_data = neo4j_client.get_user_graph_data(user_id)
-            
-            if not graph_data['nodes']:
+            # Get graph data and network HTML (cached until the graph changes;
+            # empty graphs and render failures are not cached)
+            try:
+                graph_data, html_content = _cached_graph(user_id, neo4j_client.graph_signature(user_id))
+            except _EmptyGraphError:
                 st.warning("No knowledge graph data found. Upload some documents first!")
                 return
-            
-            # Create and render network
-            html_content = self.create_network_graph(graph_data, user_id)
+            except _GraphRenderError as e:
+                st.components.v1.html(self._create_error_html(str(e)), height=200)
+                return
             
             # Display in Streamlit
             st.components.v1.html(html_content, height=700)
@@ -225,11 +333,7 @@ class GraphVisualizer:
         # Calculate statistics
         total_nodes = len(nodes)
         total_edges = len(edges)
-        node_types = {}
-        
-        for node in nodes:
-            node_type = node.get('type', 'unknown')
-            node_types[node_type] = node_types.get(node_type, 0) + 1
+        node_types = self._get_node_type_counts(nodes)
         
         # Display statistics
         st.markdown("### 📈 Graph Statistics")
@@ -286,11 +390,7 @@ class GraphVisualizer:
     
     def _get_node_type_counts(self, nodes: List[Dict[str, Any]]) -> Dict[str, int]:
         """Get counts of node types"""
-        type_counts = {}
-        for node in nodes:
-            node_type = node.get('type', 'unknown')
-            type_counts[node_type] = type_counts.get(node_type, 0) + 1
-        return type_counts
+        return dict(Counter(node.get('type', 'unknown') for node in nodes))
 
 # Global visualizer instance
 graph_visualizer = GraphVisualizer()
@@ -1,22 +1,25 @@
-import json
 import re
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Tuple
 from config.llm_config import llm_config
 from src.neo4j_client import neo4j_client
 from src.chunking.semantic_chunker import semantic_chunk
 from src.chunking.semantic_chunker import recursive_chunk_text
 
+# Upper bound on concurrent per-chunk extraction calls to the LLM provider
+MAX_CONCURRENT_EXTRACTIONS = 8
+
+# Markdown code fences (```json ... ```) around the LLM's JSON output
+_FENCE_RE = re.compile(r"```(?:json)?\s*|\s*```")
 
 
 class KnowledgeGraphExtractor:
     def __init__(self):
         self.llm = llm_config.get_llm()
 
-    def extract_entities_relationships(
-        self, text_chunk: str, user_id: str
-    ) -> Tuple[List[Dict], List[Dict]]:
-
-        extraction_prompt = f"""
+    def _build_extraction_prompt(self, text_chunk: str) -> str:
+        return f"""
 You are an academic knowledge graph extractor for university-level learning materials.
 
 Extract ONLY study-relevant knowledge. Ignore:
@@ -74,15 +77,22 @@ Return ONLY valid JSON:
 }}
 """
 
-        try:
-            response = self.llm.invoke(extraction_prompt)
-            content = self._clean_json_response(response.content.strip())
-            data = json.loads(content)
+    def _parse_extraction_response(self, content: str) -> Tuple[List[Dict], List[Dict]]:
+        content = self._clean_json_response(content.strip())
+        data = orjson.loads(content)
+
+        entities = self._clean_entities(data.get("entities", []))
+        relationships = self._clean_relationships(data.get("relationships", []))
 
-            entities = self._clean_entities(data.get("entities", []))
-            relationships = self._clean_relationships(data.get("relationships", []))
+        return entities, relationships
+
+    def extract_entities_relationships(
+        self, text_chunk: str, user_id: str
+    ) -> Tuple[List[Dict], List[Dict]]:
 
-            return entities, relationships
+        try:
+            response = self.llm.invoke(self._build_extraction_prompt(text_chunk))
+            return self._parse_extraction_response(response.content)
 
         except Exception as e:
             print("KG extraction error:", e)
@@ -91,8 +101,7 @@ Return ONLY valid JSON:
             return [], []
 
     def _clean_json_response(self, content: str) -> str:
-        content = re.sub(r"```json\s*", "", content)
-        content = re.sub(r"\s*```", "", content)
+        content = _FENCE_RE.sub("", content)
 
         start = content.find("{")
         end = content.rfind("}")
@@ -163,32 +172,50 @@ Return ONLY valid JSON:
     def process_text_chunks(self, chunks: List[str], user_id: str) -> Dict[str, int]:
         from src.query_engine import query_engine  # Import here to avoid circular import
 
-        neo4j_client.create_user_if_not_exists(user_id)
-
         total_entities = 0
         total_relationships = 0
         processed = 0
 
-        for i, chunk in enumerate(chunks):
-            if not chunk.strip():
-                continue
+        indexed_chunks = [(i, chunk) for i, chunk in enumerate(chunks) if chunk.strip()]
 
-            print(f"Processing chunk {i+1}/{len(chunks)} ({len(chunk)} chars)")
+        # LLM extraction is network-bound, so the per-chunk calls run on a
+        # thread pool while this thread stores the chunk embeddings
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_EXTRACTIONS) as executor:
+            pending = executor.map(
+                lambda chunk: self.extract_entities_relationships(chunk, user_id),
+                [chunk for _, chunk in indexed_chunks]
+            )
 
-            # Store chunk for vector search
-            chunk_id = f"{user_id}_chunk_{i}"
-            query_engine.store_document_embeddings(user_id, chunk, chunk_id)
+            for i, chunk in indexed_chunks:
+                print(f"Processing chunk {i+1}/{len(chunks)} ({len(chunk)} chars)")
 
-            entities, relationships = self.extract_entities_relationships(chunk, user_id)
+                # Store chunk for vector search
+                chunk_id = f"{user_id}_chunk_{i}"
+                query_engine.store_document_embeddings(user_id, chunk, chunk_id)
 
+            # One invalidation for the whole upload, for this user only
+            query_engine.invalidate_embeddings(user_id)
+
+            results = list(pending)
+
+        # Buffer the whole document, deduplicated across chunks, and write it
+        # in one batch per type; all entities go in before any relationship
+        # MATCHes on them. Later chunks win on entity type, as MERGE+SET did.
+        all_entities = {}
+        all_relationships = {}
+
+        for entities, relationships in results:
             if entities or relationships:
-                neo4j_client.create_entities(entities, user_id)
-                neo4j_client.create_relationships(relationships, user_id)
+                all_entities.update((e["name"], e) for e in entities)
+                all_relationships.update(((r["from"], r["type"], r["to"]), r) for r in relationships)
 
                 total_entities += len(entities)
                 total_relationships += len(relationships)
                 processed += 1
 
+        # User node, entities and relationships go in one transaction
+        neo4j_client.write_chunk(user_id, list(all_entities.values()), list(all_relationships.values()))
+
         return {
             "processed_chunks": processed,
             "total_entities": total_entities,
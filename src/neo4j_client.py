@@ -3,146 +3,280 @@ Neo4j client for direct graph operations
 """
 import json
 from typing import List, Dict, Any, Optional
+from neo4j import RoutingControl
+from neo4j.exceptions import Neo4jError
 from config.neo4j_config import neo4j_config
 
+FRAMEWORK_BY_NAME_QUERY = """
+MATCH (f:Entity {type: 'framework'})
+WHERE toLower(f.name) CONTAINS toLower($name)
+RETURN f.name AS name
+"""
+
+COMPONENTS_OF_FRAMEWORK_QUERY = """
+MATCH (f:Entity {name: $framework})-[:HAS_COMPONENT]->(c)
+RETURN c.name AS name, c.type AS type
+"""
+
+CREATE_USER_QUERY = "MERGE (u:User {id: $user_id})"
+
+CREATE_ENTITIES_QUERY = """
+UNWIND $rows AS row
+MERGE (e:Entity {user_id: $user_id, name: row.name})
+SET e.type = row.type,
+    e.created_at = datetime()
+"""
+
+CREATE_RELATIONSHIPS_QUERY = """
+UNWIND $rels AS rel
+MATCH (a:Entity {user_id: $user_id, name: rel.from})
+MATCH (b:Entity {user_id: $user_id, name: rel.to})
+MERGE (a)-[r:RELATES {type: rel.type, user_id: $user_id}]->(b)
+ON CREATE SET r.created_at = datetime()
+"""
+
+# User isolation is by the user_id property, so each query text is the same
+# for every user and its plan is compiled once
+USER_ENTITIES_QUERY = """
+MATCH (e:Entity {user_id: $user_id})
+RETURN e.name as name, e.type as type, e.user_id as user_id
+ORDER BY e.created_at DESC
+LIMIT $limit
+"""
+
+USER_RELATIONSHIPS_QUERY = """
+MATCH (a:Entity {user_id: $user_id})-[r:RELATES]->(b:Entity {user_id: $user_id})
+RETURN a.name as from_entity, b.name as to_entity, r.type as rel_type
+ORDER BY r.created_at DESC
+LIMIT $limit
+"""
+
+GRAPH_NODES_QUERY = "MATCH (e:Entity {user_id: $user_id}) RETURN e.name as id, e.type as type"
+
+GRAPH_EDGES_QUERY = """
+MATCH (a:Entity {user_id: $user_id})-[r:RELATES]->(b:Entity {user_id: $user_id})
+RETURN a.name as from, b.name as to, r.type as label
+"""
+
+GRAPH_SIGNATURE_QUERY = (
+    "MATCH (e:Entity {user_id: $user_id}) RETURN count(e) AS n, max(e.created_at) AS ts"
+)
+
+DELETE_USER_ENTITIES_QUERY = """
+MATCH (e:Entity {user_id: $user_id})
+DETACH DELETE e
+"""
+
+def _entity_rows(entities: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [{"name": e["name"], "type": e.get("type", "concept")} for e in entities]
+
+def _relationship_rows(relationships: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [
+        {"from": r["from"], "to": r["to"], "type": r.get("type", "relates_to")}
+        for r in relationships
+    ]
+
+# Entity (user_id, name) lookups are backed by a uniqueness constraint, which
+# brings its own index. Neo4j refuses it while the earlier plain index on the
+# same properties exists, so that index is dropped right before the constraint
+# and recreated if the constraint can't be created (e.g. existing duplicates).
+ENTITY_CONSTRAINT_QUERY = (
+    "CREATE CONSTRAINT entity_uid_name IF NOT EXISTS FOR (e:Entity) REQUIRE (e.user_id, e.name) IS UNIQUE"
+)
+ENTITY_CONSTRAINT_EXISTS_QUERY = "SHOW CONSTRAINTS YIELD name WHERE name = 'entity_uid_name' RETURN name"
+ENTITY_INDEX_EXISTS_QUERY = "SHOW INDEXES YIELD name WHERE name = 'entity_user_name' RETURN name"
+# Any (user_id, name) pair held by more than one Entity blocks the constraint
+ENTITY_DUPLICATE_QUERY = """
+MATCH (e:Entity)
+WITH e.user_id AS user_id, e.name AS name, count(*) AS copies
+WHERE copies > 1
+RETURN user_id, name LIMIT 1
+"""
+DROP_ENTITY_INDEX_QUERY = "DROP INDEX entity_user_name IF EXISTS"
+ENTITY_INDEX_QUERY = "CREATE INDEX entity_user_name IF NOT EXISTS FOR (e:Entity) ON (e.user_id, e.name)"
+
+# Indexes backing the user-scoped Chunk lookups
+SCHEMA_QUERIES = [
+    "CREATE INDEX chunk_uid IF NOT EXISTS FOR (c:Chunk) ON (c.user_id)",
+    "CREATE INDEX chunk_id IF NOT EXISTS FOR (c:Chunk) ON (c.id)",
+]
+
+# Fixed queries whose plans are compiled ahead of the first request
+WARMUP_QUERIES = [
+    FRAMEWORK_BY_NAME_QUERY,
+    COMPONENTS_OF_FRAMEWORK_QUERY,
+    CREATE_ENTITIES_QUERY,
+    CREATE_RELATIONSHIPS_QUERY,
+    USER_ENTITIES_QUERY,
+    USER_RELATIONSHIPS_QUERY,
+    GRAPH_NODES_QUERY,
+    GRAPH_EDGES_QUERY,
+    GRAPH_SIGNATURE_QUERY,
+]
+
 class Neo4jClient:
     def __init__(self):
         self.driver = neo4j_config.get_driver()
+        self.database = neo4j_config.database
+        
+    def run(self, query: str, params: Optional[Dict[str, Any]] = None, write: bool = False) -> List[Dict[str, Any]]:
+        """
+        Run one auto-committed query through driver.execute_query (pooled
+        session, retries on transient errors) and return the records as dicts
+        """
+        records, _, _ = self.driver.execute_query(
+            query,
+            parameters_=params or {},
+            database_=self.database,
+            routing_=RoutingControl.WRITE if write else RoutingControl.READ
+        )
+        return [record.data() for record in records]
+        
+    def _ensure_entity_key(self, session):
+        """Back Entity (user_id, name) with the uniqueness constraint, or keep the plain index"""
+        # Schema already final: nothing to do
+        if session.run(ENTITY_CONSTRAINT_EXISTS_QUERY).single() is not None:
+            return
+        
+        index_exists = session.run(ENTITY_INDEX_EXISTS_QUERY).single() is not None
+        duplicate = session.run(ENTITY_DUPLICATE_QUERY).single()
+        if duplicate is not None:
+            # The constraint can't be created until the duplicates are merged; keep the index as is
+            print(f"Neo4j entity constraint skipped: duplicate Entity "
+                  f"(user_id={duplicate['user_id']!r}, name={duplicate['name']!r}) exists; "
+                  f"keeping the (user_id, name) index")
+            if not index_exists:
+                session.run(ENTITY_INDEX_QUERY).consume()
+            return
+        
+        # The constraint brings its own index, which replaces the plain one
+        try:
+            if index_exists:
+                session.run(DROP_ENTITY_INDEX_QUERY).consume()
+            session.run(ENTITY_CONSTRAINT_QUERY).consume()
+        except Neo4jError as e:
+            print(f"Neo4j entity constraint failed, keeping the (user_id, name) index: {e}")
+            session.run(ENTITY_INDEX_QUERY).consume()
+        
+    def ensure_schema(self):
+        """
+        Create indexes/constraints if missing (no-op when they already exist).
+        Runs in a plain session rather than the retrying execute_query, so an
+        unreachable server fails once instead of being retried per statement.
+        """
+        try:
+            with self.driver.session(database=self.database) as session:
+                try:
+                    self._ensure_entity_key(session)
+                except Neo4jError as e:
+                    print(f"Neo4j entity key setup failed: {e}")
+                for query in SCHEMA_QUERIES:
+                    # A rejected statement shouldn't skip the rest; connection errors end the setup
+                    try:
+                        session.run(query).consume()
+                    except Neo4jError as e:
+                        print(f"Neo4j schema query failed ({query}): {e}")
+        except Exception as e:
+            print(f"Neo4j schema setup failed: {e}")
         
     def close(self):
-        """Close Neo4j driver"""
-        if self.driver:
-            self.driver.close()
+        """Close the shared Neo4j driver"""
+        neo4j_config.close()
+        self.driver = None
     
     def create_user_if_not_exists(self, user_id: str):
         """Create user node if it doesn't exist"""
-        with self.driver.session() as session:
-            session.run(
-                "MERGE (u:User {id: $user_id})",
-                user_id=user_id
-            )
+        self.run(CREATE_USER_QUERY, {"user_id": user_id}, write=True)
     
 
     def create_entities(self, entities: List[Dict[str, str]], user_id: str):
-        """Create entity nodes with user isolation"""
-        with self.driver.session() as session:
-            for entity in entities:
-                session.run(
-                    f"""
-                    MERGE (e:Entity:User_{user_id} {{name: $name}})
-                    SET e.type = $type,
-                        e.user_id = $user_id,
-                        e.created_at = datetime()
-                    """,
-                    name=entity["name"],
-                    type=entity.get("type", "concept"),
-                    user_id=user_id
-                )
+        """Create entity nodes with user isolation (one UNWIND query for the whole batch)"""
+        if not entities:
+            return
+        
+        self.run(
+            CREATE_ENTITIES_QUERY,
+            {"rows": _entity_rows(entities), "user_id": user_id},
+            write=True
+        )
     
 
     def create_relationships(self, relationships: List[Dict[str, str]], user_id: str):
-        """Create relationship edges with user isolation"""
-        with self.driver.session() as session:
-            for rel in relationships:
-                session.run(
-                    f"""
-                    MATCH (a:Entity:User_{user_id} {{name: $from_entity}})
-                    MATCH (b:Entity:User_{user_id} {{name: $to_entity}})
-                    MERGE (a)-[r:RELATES {{
-                        type: $rel_type,
-                        user_id: $user_id,
-                        created_at: datetime()
-                    }}]->(b)
-                    """,
-                    from_entity=rel["from"],
-                    to_entity=rel["to"],
-                    rel_type=rel.get("type", "relates_to"),
-                    user_id=user_id
-                )
+        """Create relationship edges with user isolation (one UNWIND query for the whole batch)"""
+        if not relationships:
+            return
+        
+        self.run(
+            CREATE_RELATIONSHIPS_QUERY,
+            {"rels": _relationship_rows(relationships), "user_id": user_id},
+            write=True
+        )
+    
+
+    def write_chunk(self, user_id: str, entities: List[Dict[str, str]], relationships: List[Dict[str, str]]):
+        """Write the user node, entities and relationships in a single transaction"""
+        rows = _entity_rows(entities)
+        rels = _relationship_rows(relationships)
+        
+        def work(tx):
+            tx.run(CREATE_USER_QUERY, user_id=user_id).consume()
+            if rows:
+                tx.run(CREATE_ENTITIES_QUERY, rows=rows, user_id=user_id).consume()
+            if rels:
+                tx.run(CREATE_RELATIONSHIPS_QUERY, rels=rels, user_id=user_id).consume()
+        
+        # Three statements in one transaction, so this needs a managed session
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(work)
     
 
     def get_user_entities(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's entities"""
-        with self.driver.session() as session:
-            result = session.run(
-                f"""
-                MATCH (e:Entity:User_{user_id})
-                RETURN e.name as name, e.type as type, e.user_id as user_id
-                ORDER BY e.created_at DESC
-                LIMIT $limit
-                """,
-                user_id=user_id,
-                limit=limit
-            )
-            return [dict(record) for record in result]
+        return self.run(USER_ENTITIES_QUERY, {"user_id": user_id, "limit": limit})
     
 
     def get_user_relationships(self, user_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Get user's relationships"""
-        with self.driver.session() as session:
-            result = session.run(
-                f"""
-                MATCH (a:Entity:User_{user_id})-[r:RELATES]->(b:Entity:User_{user_id})
-                RETURN a.name as from_entity, b.name as to_entity, r.type as rel_type
-                ORDER BY r.created_at DESC
-                LIMIT $limit
-                """,
-                user_id=user_id,
-                limit=limit
-            )
-            return [dict(record) for record in result]
+        return self.run(USER_RELATIONSHIPS_QUERY, {"user_id": user_id, "limit": limit})
     
 
     def get_user_graph_data(self, user_id: str) -> Dict[str, Any]:
         """Get complete graph data for visualization"""
-        with self.driver.session() as session:
-            # Get entities
-            entities_result = session.run(
-                f"MATCH (e:Entity:User_{user_id}) RETURN e.name as id, e.type as type",
-                user_id=user_id
-            )
-            entities = [{"id": record["id"], "label": record["id"], "type": record["type"]} 
-                       for record in entities_result]
-            
-            # Get relationships
-            rels_result = session.run(
-                f"""
-                MATCH (a:Entity:User_{user_id})-[r:RELATES]->(b:Entity:User_{user_id})
-                RETURN a.name as from, b.name as to, r.type as label
-                """,
-                user_id=user_id
-            )
-            relationships = [{"from": record["from"], "to": record["to"], "label": record["label"]}
-                           for record in rels_result]
-            
-            return {"nodes": entities, "edges": relationships}
+        # Get entities
+        entities = [{"id": record["id"], "label": record["id"], "type": record["type"]} 
+                   for record in self.run(GRAPH_NODES_QUERY, {"user_id": user_id})]
+        
+        # Get relationships
+        relationships = [{"from": record["from"], "to": record["to"], "label": record["label"]}
+                       for record in self.run(GRAPH_EDGES_QUERY, {"user_id": user_id})]
+        
+        return {"nodes": entities, "edges": relationships}
+    
+
+    def graph_signature(self, user_id: str) -> tuple:
+        """Cheap fingerprint of a user's graph (entity count, latest write) for cache keys"""
+        records = self.run(GRAPH_SIGNATURE_QUERY, {"user_id": user_id})
+        return (records[0]["n"], str(records[0]["ts"])) if records else (0, "None")
     
 
     def delete_user_data(self, user_id: str):
         """Delete all user data (for testing/reset)"""
-        with self.driver.session() as session:
-            session.run(
-                f"""
-                MATCH (e:Entity:User_{user_id})
-                DETACH DELETE e
-                """,
-                user_id=user_id
-            )
+        self.run(DELETE_USER_ENTITIES_QUERY, {"user_id": user_id}, write=True)
 
     def get_framework_by_name(self, name: str):
-        query = """
-        MATCH (f:Entity {type: 'framework'})
-        WHERE toLower(f.name) CONTAINS toLower($name)
-        RETURN f.name AS name
-        """
-        return self.run(query, {"name": name})
+        return self.run(FRAMEWORK_BY_NAME_QUERY, {"name": name})
 
     def get_components_of_framework(self, framework_name: str):
-        query = """
-        MATCH (f:Entity {name: $framework})-[:HAS_COMPONENT]->(c)
-        RETURN c.name AS name, c.type AS type
-        """
-        return self.run(query, {"framework": framework_name})
+        return self.run(COMPONENTS_OF_FRAMEWORK_QUERY, {"framework": framework_name})
+
+    def warm_query_plans(self):
+        """Compile plans for the fixed queries with EXPLAIN (nothing is executed)"""
+        try:
+            with self.driver.session(database=self.database) as session:
+                for query in WARMUP_QUERIES:
+                    session.run("EXPLAIN " + query).consume()
+        except Exception as e:
+            print(f"Neo4j plan warmup failed: {e}")
 
 # Global client instance
 neo4j_client = Neo4jClient()
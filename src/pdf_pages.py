@@ -0,0 +1,69 @@
+"""
+PDF page text extraction that can run in worker processes
+
+Kept separate from upload_handler so pool workers only import PyMuPDF,
+not EasyOCR/Streamlit and the OCR reader created there.
+"""
+import os
+import functools
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import fitz
+
+# Below this many pages, or this many bytes, the pool costs more than it saves
+PARALLEL_MIN_PAGES = 4
+PARALLEL_MIN_BYTES = 1024 * 1024
+MAX_PDF_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all uploads, started on first use"""
+    # spawn, not fork: the app process is multi-threaded (Streamlit, torch,
+    # the Neo4j driver), and forking it can deadlock the children
+    return ProcessPoolExecutor(
+        max_workers=MAX_PDF_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop); each worker opens the document from disk"""
+    pdf_document = fitz.open(pdf_path)
+    try:
+        return [pdf_document.load_page(i).get_text() for i in range(start, stop)]
+    finally:
+        pdf_document.close()
+
+
+def extract_pages(pdf_document: fitz.Document, pdf_bytes: bytes) -> List[str]:
+    """
+    Text of every page, in page order. Small PDFs are read from the
+    caller's open document; large ones are split across the process pool.
+    """
+    page_count = len(pdf_document)
+    if page_count < PARALLEL_MIN_PAGES or len(pdf_bytes) < PARALLEL_MIN_BYTES or MAX_PDF_WORKERS < 2:
+        return [page.get_text() for page in pdf_document]
+
+    # One contiguous page range per worker; workers read the PDF from a temp
+    # file instead of each being sent a pickled copy of its bytes
+    workers = min(MAX_PDF_WORKERS, page_count)
+    step = -(-page_count // workers)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+    try:
+        futures = [_get_pool().submit(extract_page_range, f.name, start, stop) for start, stop in ranges]
+        return [text for future in futures for text in future.result()]
+    except BrokenProcessPool as e:
+        # A crashed worker breaks the pool for good; start a new one next time
+        print(f"PDF worker pool failed, extracting in-process: {e}")
+        _get_pool.cache_clear()
+        return [page.get_text() for page in pdf_document]
+    finally:
+        os.remove(f.name)
@@ -2,16 +2,103 @@
 """
 Hybrid Query Engine: Vector similarity + Graph traversal for personal RAG
 """
-import json
-from typing import List, Dict, Any, Optional
+import os
+import re
+import shutil
+import threading
+import orjson
+from typing import List, Dict, Any, Optional, Generator
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import streamlit as st
+from cachetools import LRUCache
 from config.llm_config import llm_config
 from src.neo4j_client import neo4j_client
 from src.agent.agent_structurer import build_structured_context
 from src.agent.answer_generator import generate_answer
+from src.agent.intent_classifier import INTENT_LINE_INSTRUCTION, split_intent_line, strip_intent_line
+
+NO_CONTEXT_ANSWER = "I could not find this topic in your uploaded materials."
+
+# Everything reachable from the concept within `depth` hops, in one round trip;
+# each relationship is returned once however many paths share it
+GRAPH_CONTEXT_QUERY = """
+MATCH (c:Entity {user_id: $user_id, name: $concept})
+OPTIONAL MATCH p = (c)-[*1..%d]->()
+UNWIND CASE WHEN p IS NULL THEN [null] ELSE relationships(p) END AS r
+WITH c, collect(DISTINCT r) AS rels
+RETURN c, [r IN rels | {
+    from: startNode(r).name, from_type: startNode(r).type,
+    to: endNode(r).name, to_type: endNode(r).type,
+    type: r.type
+}] AS rels
+"""
+
+# Per-user normalized embedding matrices persisted as .npy and memory-mapped
+# on load; Neo4j stays the source of truth and rebuilds them on a miss.
+# Each cache is tagged with the chunk signature (count, latest write) it was
+# built from, so a same-size re-upload or a stale file never passes as current.
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+CHUNK_SIGNATURE_QUERY = (
+    "MATCH (c:Chunk {user_id: $user_id}) RETURN count(c) AS n, max(c.updated_at) AS ts"
+)
+
+def _embedding_cache_dir(user_id: str) -> str:
+    """Directory holding one user's cached matrix and its metadata"""
+    return os.path.join(EMBEDDING_CACHE_DIR, re.sub(r"[^\w.-]", "_", user_id))
+
+def _matrix_file(signature: tuple) -> str:
+    """Matrix file name for a signature, so a new matrix never overwrites one in use"""
+    return "matrix_%d_%s.npy" % signature
+
+def _read_embedding_cache(user_id: str, signature: tuple):
+    """Memory-map a user's cached matrix; None when missing or built from other chunks"""
+    cache_dir = _embedding_cache_dir(user_id)
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), "rb") as f:
+            meta = orjson.loads(f.read())
+        if not isinstance(meta, dict) or tuple(meta["signature"]) != signature:
+            return None
+        chunk_ids = meta["ids"]
+        matrix = np.load(os.path.join(cache_dir, _matrix_file(signature)), mmap_mode="r")
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if len(chunk_ids) != signature[0] or matrix.shape[0] != signature[0]:
+        return None
+    return chunk_ids, matrix
+
+def _write_embedding_cache(user_id: str, signature: tuple, chunk_ids: List[str], matrix: np.ndarray):
+    """Persist a user's matrix, then the metadata pointing at it (each via temp file + rename)"""
+    cache_dir = _embedding_cache_dir(user_id)
+    matrix_name = _matrix_file(signature)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        matrix_path = os.path.join(cache_dir, matrix_name)
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        
+        meta_path = os.path.join(cache_dir, "meta.json")
+        with open(meta_path + ".tmp", "wb") as f:
+            f.write(orjson.dumps({"signature": list(signature), "ids": chunk_ids}))
+        os.replace(meta_path + ".tmp", meta_path)
+        
+        # Older matrices are unreachable now (open memory maps keep working)
+        for name in os.listdir(cache_dir):
+            if name.endswith(".npy") and name != matrix_name:
+                os.remove(os.path.join(cache_dir, name))
+    except OSError as e:
+        print(f"Could not write embedding cache for {user_id}: {e}")
+
+def _drop_embedding_cache(user_id: str):
+    """Remove a user's cached matrix so the next search rebuilds it"""
+    shutil.rmtree(_embedding_cache_dir(user_id), ignore_errors=True)
+
+def _quantize_int8(vector: np.ndarray):
+    """Quantize an embedding to int8 bytes with a per-vector scale (max(|v|) / 127)"""
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8).tobytes(), scale
 
 class QueryEngine:
     def __init__(self):
@@ -24,6 +111,10 @@ class QueryEngine:
         
         self.embedding_model = get_embedding_model()
         
+        # user_id -> (chunk signature, chunk ids, matrix) of the last loaded matrix
+        self._chunk_matrices = LRUCache(maxsize=32)
+        self._chunk_matrices_lock = threading.Lock()
+        
     def encode_texts(self, texts: List[str]) -> np.ndarray:
         """Encode texts to embeddings"""
         if not texts:
@@ -40,22 +131,108 @@ class QueryEngine:
         # This is a simplified approach
         # In production, use: Pinecone, Weaviate, ChromaDB, etc.
         embedding = self.encode_texts([document_text])[0]
+        # Unit length, so cosine similarity at query time is a plain dot product
+        embedding = embedding / (np.linalg.norm(embedding) + 1e-12)
         
 
-        # Store chunk as Neo4j node with embedding (as string for demo)
-        with neo4j_client.driver.session() as session:
-            session.run(
-                f"""
-                MERGE (c:Chunk:User_{user_id} {{id: $chunk_id}})
-                SET c.text = $text,
-                    c.embedding = $embedding,
-                    c.user_id = $user_id
-                """,
-                chunk_id=chunk_id,
-                text=document_text,  # Store first 1000 chars
-                embedding=json.dumps(embedding.tolist()),
-                user_id=user_id
-            )
+        embedding_q8, scale = _quantize_int8(embedding)
+
+        # Store chunk as Neo4j node with an int8-quantized embedding (384 bytes + scale)
+        neo4j_client.run(
+            """
+            MERGE (c:Chunk {id: $chunk_id})
+            SET c.text = $text,
+                c.embedding_q8 = $embedding_q8,
+                c.scale = $scale,
+                c.user_id = $user_id,
+                c.updated_at = timestamp()
+            REMOVE c.embedding
+            """,
+            {
+                "chunk_id": chunk_id,
+                "text": document_text,  # Store first 1000 chars
+                "embedding_q8": embedding_q8,
+                "scale": scale,
+                "user_id": user_id
+            },
+            write=True
+        )
+    
+    def invalidate_embeddings(self, user_id: str):
+        """Drop one user's cached matrix after their chunks changed (call once per upload)"""
+        with self._chunk_matrices_lock:
+            self._chunk_matrices.pop(user_id, None)
+        _drop_embedding_cache(user_id)
+    
+    def _chunk_signature(self, user_id: str) -> tuple:
+        """(chunk count, latest chunk write) for a user; changes whenever a chunk is stored"""
+        records = neo4j_client.run(CHUNK_SIGNATURE_QUERY, {"user_id": user_id})
+        if not records:
+            return 0, None
+        return records[0]["n"], records[0]["ts"]
+    
+    def _load_chunk_matrix(self, user_id: str, signature: tuple):
+        """
+        A user's chunk ids and row-normalized embedding matrix, from memory,
+        memory-mapped from the on-disk cache, or rebuilt from Neo4j.
+        Callers read the signature first, so a matrix rebuilt during an
+        upload is never older than the signature it is stored under.
+        """
+        with self._chunk_matrices_lock:
+            cached = self._chunk_matrices.get(user_id)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        
+        loaded = _read_embedding_cache(user_id, signature)
+        if loaded is None:
+            loaded = self._fetch_chunk_matrix(user_id)
+            # Only a complete snapshot of this signature is persisted
+            if loaded[0] and len(loaded[0]) == signature[0]:
+                _write_embedding_cache(user_id, signature, *loaded)
+                loaded = _read_embedding_cache(user_id, signature) or loaded
+        
+        with self._chunk_matrices_lock:
+            self._chunk_matrices[user_id] = (signature, *loaded)
+        return loaded
+    
+    def _fetch_chunk_matrix(self, user_id: str):
+        """Dequantize a user's stored embeddings from Neo4j into one row-normalized matrix"""
+        records = neo4j_client.run(
+            """
+            MATCH (c:Chunk {user_id: $user_id})
+            RETURN c.id as id, c.embedding_q8 as embedding_q8,
+                   c.scale as scale, c.embedding as embedding
+            """,
+            {"user_id": user_id}
+        )
+        
+        chunk_ids = []
+        vectors = []
+        for record in records:
+            chunk_ids.append(record["id"])
+            if record["embedding_q8"] is not None:
+                vectors.append(np.frombuffer(record["embedding_q8"], dtype=np.int8) * record["scale"])
+                continue
+            # Chunks written before quantization hold floats (list or JSON string)
+            embedding = record["embedding"]
+            vectors.append(orjson.loads(embedding) if isinstance(embedding, str) else embedding)
+        
+        matrix = np.array(vectors, dtype=np.float32)
+        # Re-normalize after dequantization (and for chunks stored before normalization)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return chunk_ids, matrix / np.where(norms == 0, 1, norms)
+    
+    def _fetch_chunk_texts(self, user_id: str, chunk_ids: List[str]) -> Dict[str, str]:
+        """Texts of the given chunks, keyed by chunk id"""
+        records = neo4j_client.run(
+            """
+            MATCH (c:Chunk {user_id: $user_id})
+            WHERE c.id IN $chunk_ids
+            RETURN c.id as id, c.text as text
+            """,
+            {"user_id": user_id, "chunk_ids": chunk_ids}
+        )
+        return {record["id"]: record["text"] for record in records}
     
     def vector_search(self, query: str, user_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -70,67 +247,67 @@ class QueryEngine:
             List of relevant document chunks
         """
 
-        # Get user's document chunks from Neo4j
-        with neo4j_client.driver.session() as session:
-            result = session.run(
-                f"""
-                MATCH (c:Chunk:User_{user_id})
-                RETURN c.id as id, c.text as text
-                """,
-                user_id=user_id
-            )
-            
-            chunks = [{"id": record["id"], "text": record["text"]} for record in result]
+        # Get user's document chunks with their stored embeddings (cached)
+        signature = self._chunk_signature(user_id)
+        if not signature[0]:
+            return []
         
-        if not chunks:
+        chunk_ids, chunk_embeddings = self._load_chunk_matrix(user_id, signature)
+        if not chunk_ids:
             return []
         
-        # Encode query and document chunks
-        chunk_texts = [chunk["text"] for chunk in chunks]
+        # Only the query needs encoding; chunk embeddings were stored at upload
         query_embedding = self.encode_texts([query])[0]
-        chunk_embeddings = self.encode_texts(chunk_texts)
+        query_embedding = query_embedding / (np.linalg.norm(query_embedding) + 1e-12)
         
-        # Calculate cosine similarities
-        similarities = cosine_similarity([query_embedding], chunk_embeddings)[0]
+        # Cosine similarities: rows and query are unit length
+        similarities = chunk_embeddings @ query_embedding
         
-        # Get top-k most similar chunks
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # Get top-k most similar chunks: partition in O(N), then sort only those k
+        if similarities.size <= top_k:
+            top_indices = np.argsort(-similarities)
+        else:
+            top_indices = np.argpartition(-similarities, top_k)[:top_k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
+        top_indices = [idx for idx in top_indices if similarities[idx] > 0.1]  # Threshold for relevance
+        if not top_indices:
+            return []
+        
+        # Only the winning chunks' texts are fetched
+        texts = self._fetch_chunk_texts(user_id, [chunk_ids[idx] for idx in top_indices])
         
         results = []
         for idx in top_indices:
-            if similarities[idx] > 0.1:  # Threshold for relevance
+            chunk_id = chunk_ids[idx]
+            if chunk_id in texts:
                 results.append({
-                    "chunk": chunks[idx],
+                    "chunk": {"id": chunk_id, "text": texts[chunk_id]},
                     "similarity": float(similarities[idx])
                 })
         
         return results
     
     def get_graph_context(self, concept: str, user_id: str, depth: int = 2):
-        with neo4j_client.driver.session() as session:
-            result = session.run(
-                f"""
-                MATCH (c:Entity:User_{user_id} {{name: $concept}})
-                OPTIONAL MATCH (c)-[r]->(n)
-                RETURN c, r, n
-                """,
-                concept=concept
-            )
-
-            entities = set()
-            relationships = []
-
-            for record in result:
-                if record["c"]:
-                    entities.add((record["c"]["name"], record["c"]["type"]))
-                if record["n"]:
-                    entities.add((record["n"]["name"], record["n"]["type"]))
-                if record["r"]:
-                    relationships.append({
-                        "from": record["c"]["name"],
-                        "to": record["n"]["name"],
-                        "type": record["r"]["type"]
-                    })
+        records = neo4j_client.run(
+            # Variable-length bounds can't be parameters; depth is an int
+            GRAPH_CONTEXT_QUERY % max(1, int(depth)),
+            {"user_id": user_id, "concept": concept}
+        )
+
+        entities = set()
+        relationships = []
+
+        # At most one record: the concept node plus every relationship under it
+        for record in records:
+            entities.add((record["c"]["name"], record["c"]["type"]))
+            for rel in record["rels"]:
+                entities.add((rel["from"], rel["from_type"]))
+                entities.add((rel["to"], rel["to_type"]))
+                relationships.append({
+                    "from": rel["from"],
+                    "to": rel["to"],
+                    "type": rel["type"]
+                })
 
         return {
             "entities": [{"name": e[0], "type": e[1]} for e in entities],
@@ -148,7 +325,8 @@ class QueryEngine:
         response = self.llm.invoke(prompt)
         return response.content.strip()
     
-    def generate_answer(self, question: str, user_id: str):
+    def _build_answer_prompt(self, question: str, user_id: str) -> Optional[str]:
+        """Retrieve context for the question; returns None when nothing relevant is found"""
 
         concept = self.extract_main_concept(question)
         print(f"Extracted concept: '{concept}'")
@@ -161,11 +339,15 @@ class QueryEngine:
             vector_results = self.vector_search(question, user_id, top_k=3)
             print(f"Vector search results: {len(vector_results)}")
 
-            if vector_results:
-                # Use vector results directly
-                context_text = "\n".join([result["chunk"]["text"] for result in vector_results])
-                prompt = f"""
-                Answer the question based on the following context from the user's materials:
+            if not vector_results:
+                return None
+
+            # Use vector results directly
+            context_text = "\n".join([result["chunk"]["text"] for result in vector_results])
+            return f"""
+                Answer the question based on the following context from the user's materials.
+
+                {INTENT_LINE_INSTRUCTION}
 
                 Context:
                 {context_text}
@@ -174,16 +356,6 @@ class QueryEngine:
 
                 Provide a helpful answer based only on the context provided.
                 """
-                response = self.llm.invoke(prompt)
-                return {
-                    "answer": response.content,
-                    "success": True
-                }
-            else:
-                return {
-                    "answer": "I could not find this topic in your uploaded materials.",
-                    "success": False
-                }
 
         vector_results = self.vector_search(concept, user_id)
 
@@ -192,11 +364,51 @@ class QueryEngine:
             vector_results
         )
 
-        prompt = generate_answer(question, structured_context)
+        return generate_answer(question, structured_context)
+
+    def generate_answer(self, question: str, user_id: str):
+        prompt = self._build_answer_prompt(question, user_id)
+        if prompt is None:
+            return {
+                "answer": NO_CONTEXT_ANSWER,
+                "success": False
+            }
+
         response = self.llm.invoke(prompt)
+        intent, answer = split_intent_line(response.content)
+
+        return {
+            "answer": answer,
+            "intent": intent,
+            "success": True
+        }
+
+    def stream_answer(self, question: str, user_id: str) -> Generator[str, None, dict]:
+        """
+        Like generate_answer, but yields the answer text as the LLM produces it.
+        Returns the same result dict as generate_answer; when no context is
+        found nothing is yielded and the result has success False.
+        """
+        prompt = self._build_answer_prompt(question, user_id)
+        if prompt is None:
+            return {
+                "answer": NO_CONTEXT_ANSWER,
+                "success": False
+            }
+
+        raw_parts = []
+
+        def recorded_chunks():
+            for chunk in self.llm.stream(prompt):
+                raw_parts.append(chunk.content)
+                yield chunk.content
+
+        yield from strip_intent_line(recorded_chunks())
+        intent, answer = split_intent_line("".join(raw_parts))
 
         return {
-            "answer": response.content,
+            "answer": answer,
+            "intent": intent,
             "success": True
         }
 
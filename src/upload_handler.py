@@ -1,116 +1,323 @@
 """
 File upload and OCR processing handler
 """
-import os
 import io
-from typing import Optional, Union
-import easyocr
+import os
+import functools
+from typing import IO, List
+import numpy as np
 from PIL import Image
+import streamlit as st
 
+# easyocr (torch) and fitz are imported where they are first needed, so
+# importing this module, and text-only uploads, stay cheap
 
+# Size of the blank frame the OCR reader is warmed up with
+OCR_WARMUP_WIDTH = 800
+OCR_WARMUP_HEIGHT = 600
 
-import fitz
-import streamlit as st
+# Uploaded images are downscaled so their longest side is at most this;
+# detector cost grows with pixel count and document text stays legible
+OCR_MAX_IMAGE_SIDE = 1600
+
+# PDF pages with less text than this are treated as scans and OCR'd
+PDF_MIN_PAGE_TEXT = 20
+PDF_OCR_DPI = 150
+# Rendered pages OCR'd per batch (bounds memory for long scanned PDFs)
+PDF_OCR_BATCH_PAGES = 8
+
+# Text uploads are decoded and whitespace-normalized in blocks of this many characters
+TXT_READ_CHARS = 1 << 20
+
+# OCR engine: easyocr (default), paddle (paddleocr) or tesseract (pytesseract);
+# the latter two are optional installs that are much faster on CPU
+OCR_BACKEND = os.getenv("UPLOAD_OCR_BACKEND", "easyocr").strip().lower()
+
+# Opt-in: on CPU torch.compile needs a C++ toolchain at runtime and
+# recompiles for new input shapes, so it only pays off on long-running servers
+OCR_TORCH_COMPILE = os.getenv("OCR_TORCH_COMPILE", "0") == "1"
+
+@st.cache_resource
+def get_ocr_reader():
+    """EasyOCR reader, loaded once per process (module scope keeps the cache key stable)"""
+    import easyocr
+    
+    # quantize=True: int8 dynamic quantization of the CPU detector/recognizer
+    reader = easyocr.Reader(['en'], gpu=False, quantize=True)
+    warmup_frame = np.zeros([1, OCR_WARMUP_HEIGHT, OCR_WARMUP_WIDTH, 3], dtype=np.uint8)
+    
+    if OCR_TORCH_COMPILE:
+        detector, recognizer = reader.detector, reader.recognizer
+        try:
+            import torch
+            reader.detector = torch.compile(detector)
+            reader.recognizer = torch.compile(recognizer)
+            # Compilation happens on first call, so do it here, once
+            reader.readtext_batched(warmup_frame)
+            return reader
+        except Exception as e:
+            print(f"OCR torch.compile failed, using eager models: {e}")
+            reader.detector, reader.recognizer = detector, recognizer
+    
+    # One throwaway pass so the first real upload doesn't pay the cold start
+    reader.readtext_batched(warmup_frame)
+    return reader
+
+@st.cache_resource
+def get_paddle_ocr():
+    """PaddleOCR engine (CPU, MKL-DNN), loaded once per process"""
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=False, lang='en', enable_mkldnn=True, cpu_threads=os.cpu_count() or 1)
+
+@functools.lru_cache(maxsize=1)
+def resolve_ocr_backend() -> str:
+    """Configured OCR backend, or easyocr when its package isn't installed"""
+    try:
+        if OCR_BACKEND == "paddle":
+            import paddleocr
+            return "paddle"
+        if OCR_BACKEND == "tesseract":
+            import pytesseract
+            return "tesseract"
+    except ImportError as e:
+        print(f"OCR backend '{OCR_BACKEND}' unavailable ({e}), using easyocr")
+    return "easyocr"
 
 class UploadHandler:
-    def __init__(self):
-        # Initialize EasyOCR reader (cached for performance)
-        @st.cache_resource
-        def get_ocr_reader():
-            return easyocr.Reader(['en'], gpu=False)
-        
-        self.ocr_reader = get_ocr_reader()
+    @property
+    def ocr_reader(self):
+        """EasyOCR reader, loaded on first OCR use so text/PDF/PPTX uploads never pay for it"""
+        return get_ocr_reader()
         
-    def extract_text_from_pdf(self, file_content: bytes) -> str:
+    def extract_text_from_pdf(self, file_obj: IO[bytes]) -> str:
         """Extract text from PDF using PyMuPDF (better than PyPDF2)"""
         try:
-            pdf_document = fitz.open(stream=io.BytesIO(file_content), filetype="pdf")
-            text_content = []
+            import fitz
+            from src.pdf_pages import extract_pages
             
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                text_content.append(page.get_text())
+            # PyMuPDF needs the whole document in memory; read it only for the parse
+            pdf_bytes = file_obj.read()
+            pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+            
+            try:
+                # Read from the open document; only large PDFs go to worker processes
+                text_content = extract_pages(pdf_document, pdf_bytes)
+                
+                # Pages without a usable text layer (scans) are rendered and OCR'd
+                scanned = [i for i, text in enumerate(text_content) if len(text.strip()) < PDF_MIN_PAGE_TEXT]
+                for batch_start in range(0, len(scanned), PDF_OCR_BATCH_PAGES):
+                    batch = scanned[batch_start:batch_start + PDF_OCR_BATCH_PAGES]
+                    images = [self._render_pdf_page(pdf_document.load_page(i)) for i in batch]
+                    for i, text in zip(batch, self._ocr_images(images)):
+                        text_content[i] = text or text_content[i]
+            finally:
+                pdf_document.close()
             
-            pdf_document.close()
             return "\n".join(text_content)
         except Exception as e:
             print(f"PDF extraction error: {e}")
             return ""
     
-    def extract_text_from_txt(self, file_content: bytes) -> str:
-        """Extract text from TXT file"""
+    def extract_text_from_txt(self, file_obj: IO[bytes]) -> str:
+        """Extract text from TXT file, collapsing whitespace block by block as it decodes"""
         try:
-            return file_content.decode('utf-8', errors='ignore')
+            reader = io.TextIOWrapper(file_obj, encoding='utf-8', errors='ignore')
+            try:
+                parts = []
+                carry = ""
+                while True:
+                    block = reader.read(TXT_READ_CHARS)
+                    if not block:
+                        break
+                    words = (carry + block).split()
+                    # A word cut by the block boundary continues in the next block
+                    carry = words.pop() if words and not block[-1].isspace() else ""
+                    if words:
+                        parts.append(" ".join(words))
+                if carry:
+                    parts.append(carry)
+                
+                return " ".join(parts)
+            finally:
+                # Leave the caller's file open
+                reader.detach()
         except Exception as e:
             print(f"TXT extraction error: {e}")
             return ""
     
 
-    def extract_text_from_image(self, file_content: bytes) -> str:
+    def _render_pdf_page(self, page) -> np.ndarray:
+        """Render a PDF page straight into a BGR array (no PNG round trip)"""
+        pix = page.get_pixmap(dpi=PDF_OCR_DPI)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        return np.ascontiguousarray(pixels[:, :, 2::-1])
+    
+    def _decode_image(self, file_obj: IO[bytes]) -> np.ndarray:
+        """Decode an image file into the BGR uint8 array EasyOCR expects"""
+        with Image.open(file_obj) as image:
+            scale = min(1.0, OCR_MAX_IMAGE_SIDE / max(image.size))
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            if scale < 1.0:
+                # JPEGs can be decoded at a reduced size directly (no-op for other formats)
+                image.draft("RGB", size)
+            
+            # EasyOCR only accepts JPEG PIL images, so convert to an array ourselves
+            rgb = image.convert("RGB")
+        
+        if rgb.size != size:
+            rgb = rgb.resize(size, Image.BILINEAR)
+        # PIL's raw encoder writes BGR in one pass: a single copy instead of
+        # np.asarray plus a contiguous channel flip (the array is read-only)
+        bgr = rgb.tobytes("raw", "BGR")
+        return np.frombuffer(bgr, dtype=np.uint8).reshape(rgb.height, rgb.width, 3)
+    
+    def _confident_text(self, results) -> str:
+        """Join the OCR results above the confidence threshold"""
+        # Only include confident extractions
+        return " ".join(text for _, text, confidence in results if confidence > 0.5)
+    
+    def extract_text_from_image(self, file_obj: IO[bytes]) -> str:
         """Extract text from image using EasyOCR"""
+        return self.extract_text_from_images_batch([file_obj])[0]
+    
+    def extract_text_from_images_batch(self, file_objs: List[IO[bytes]]) -> List[str]:
+        """
+        Extract text from several images with one batched EasyOCR pass
+        
+        Images of the same size are detected as one batch; images of other
+        sizes are OCR'd on their own, so none are stretched or distorted.
+        Returns one string per image ("" for images that failed).
+        """
+        images = []
+        for file_obj in file_objs:
+            try:
+                images.append(self._decode_image(file_obj))
+            except Exception as e:
+                print(f"OCR extraction error: {e}")
+                images.append(None)
+        
+        texts = [""] * len(images)
+        valid = [i for i, image in enumerate(images) if image is not None]
+        
+        for i, text in zip(valid, self._ocr_images([images[i] for i in valid])):
+            texts[i] = text
+        
+        return texts
+    
+    def _paddle_text(self, image: np.ndarray) -> str:
+        """OCR one BGR image with PaddleOCR, keeping confident lines"""
+        pages = get_paddle_ocr().ocr(image, cls=False)
+        lines = pages[0] if pages and pages[0] else []
+        return self._confident_text((bbox, text, confidence) for bbox, (text, confidence) in lines)
+    
+    def _tesseract_text(self, image: np.ndarray) -> str:
+        """OCR one BGR image with Tesseract, keeping confident words"""
+        import pytesseract
+        rgb = np.ascontiguousarray(image[:, :, ::-1])
+        data = pytesseract.image_to_data(rgb, output_type=pytesseract.Output.DICT)
+        # Tesseract confidences are 0-100 (-1 for non-word boxes)
+        return self._confident_text(
+            (None, text, float(conf) / 100)
+            for text, conf in zip(data["text"], data["conf"]) if text.strip()
+        )
+    
+    def _ocr_images(self, images: List[np.ndarray]) -> List[str]:
+        """OCR decoded BGR images, batching those of the same size"""
+        if not images:
+            return []
+        
+        backend = resolve_ocr_backend()
+        if backend != "easyocr":
+            # Paddle and Tesseract take one image per call
+            texts = []
+            for image in images:
+                try:
+                    texts.append(self._paddle_text(image) if backend == "paddle" else self._tesseract_text(image))
+                except Exception as e:
+                    print(f"OCR extraction error: {e}")
+                    texts.append("")
+            return texts
+        
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(file_content))
-            
-            # Use EasyOCR to extract text
-            results = self.ocr_reader.readtext(image)
+            # readtext_batched needs equally sized images; resizing to a common
+            # size would distort aspect ratios, so batch per size instead
+            by_shape = {}
+            for i, image in enumerate(images):
+                by_shape.setdefault(image.shape, []).append(i)
             
-            # Extract text from results
-            extracted_text = []
-            for (bbox, text, confidence) in results:
-                if confidence > 0.5:  # Only include confident extractions
-                    extracted_text.append(text)
+            texts = [""] * len(images)
+            for indices in by_shape.values():
+                if len(indices) == 1:
+                    results = [self.ocr_reader.readtext(images[indices[0]])]
+                else:
+                    results = self.ocr_reader.readtext_batched(
+                        [images[i] for i in indices],
+                        batch_size=len(indices)
+                    )
+                for i, image_results in zip(indices, results):
+                    texts[i] = self._confident_text(image_results)
             
-            return " ".join(extracted_text)
+            return texts
         except Exception as e:
             print(f"OCR extraction error: {e}")
-            return ""
+            return [""] * len(images)
+    
+    def _shape_lines(self, shape):
+        """Text lines of one slide shape: a title once, other text as one bullet per paragraph"""
+        if not shape.has_text_frame:
+            return
+        
+        # Title placeholders keep their marker; their text isn't repeated as a bullet
+        if shape.is_placeholder and shape.placeholder_format.type == 1:
+            text = shape.text_frame.text.strip()
+            if text:
+                yield f"TITLE: {text}"
+            return
+        
+        for paragraph in shape.text_frame.paragraphs:
+            text = paragraph.text.strip()
+            if text:
+                yield f"• {text}"
+    
+    def _slide_lines(self, slide_idx: int, slide):
+        """Header plus text lines of one slide; nothing for slides without text"""
+        lines = (line for shape in slide.shapes for line in self._shape_lines(shape))
+        # Peek for a first line so empty slides get no header, without buffering the slide
+        first = next(lines, None)
+        if first is None:
+            return
+        
+        yield f"\n=== SLIDE {slide_idx} ==="
+        yield first
+        yield from lines
     
-    def extract_text_from_pptx(self, file_content: bytes) -> str:
+    def extract_text_from_pptx(self, file_obj: IO[bytes]) -> str:
         """Extract text from PowerPoint (.pptx) files"""
         try:
             from pptx import Presentation
             
-            presentation = Presentation(io.BytesIO(file_content))
-            all_text = []
+            presentation = Presentation(file_obj)
             
-            for slide_idx, slide in enumerate(presentation.slides, 1):
-                slide_text = [f"\n=== SLIDE {slide_idx} ==="]
-                
-                # Extract from all shapes in the slide
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        # Identify if it's a title vs content
-                        try:
-                            if hasattr(shape, "placeholder_format") and shape.placeholder_format:
-                                if shape.placeholder_format.type == 1:  # Title
-                                    slide_text.append(f"TITLE: {shape.text.strip()}")
-                                else:
-                                    slide_text.append(shape.text.strip())
-                            else:
-                                slide_text.append(shape.text.strip())
-                        except:
-                            # If we can't determine the type, just add the text
-                            slide_text.append(shape.text.strip())
-                    
-                    # Extract bullet points if present
-                    if hasattr(shape, "text_frame"):
-                        for paragraph in shape.text_frame.paragraphs:
-                            if paragraph.text.strip():
-                                slide_text.append(f"• {paragraph.text.strip()}")
-                
-                if len(slide_text) > 1:  # More than just the slide header
-                    all_text.extend(slide_text)
-            
-            return "\n".join(all_text)
+            # One join over a generator of every slide's lines
+            return "\n".join(
+                line
+                for slide_idx, slide in enumerate(presentation.slides, 1)
+                for line in self._slide_lines(slide_idx, slide)
+            )
         except Exception as e:
             print(f"PPTX extraction error: {e}")
             return ""
     
-    def process_upload(self, file_data: bytes, filename: str, user_id: str) -> tuple[str, str]:
+    def process_upload(self, file_obj: IO[bytes], filename: str, user_id: str) -> tuple[str, str]:
         """
         Process uploaded file and return extracted text and file type
         
+        Args:
+            file_obj: Binary file-like object (e.g. Streamlit's UploadedFile);
+                extractors read from it directly instead of a copied bytes blob
+            filename: Original filename, used to pick the extractor
+            user_id: User identifier
+        
         Returns:
             tuple: (extracted_text, file_type)
         """
@@ -122,23 +329,28 @@ class UploadHandler:
         
 
         try:
+            file_obj.seek(0)
+            
             if file_extension == 'pdf':
-                extracted_text = self.extract_text_from_pdf(file_data)
+                extracted_text = self.extract_text_from_pdf(file_obj)
                 file_type = "pdf"
             elif file_extension == 'pptx':
-                extracted_text = self.extract_text_from_pptx(file_data)
+                extracted_text = self.extract_text_from_pptx(file_obj)
                 file_type = "powerpoint"
             elif file_extension in ['txt', 'md']:
-                extracted_text = self.extract_text_from_txt(file_data)
+                extracted_text = self.extract_text_from_txt(file_obj)
                 file_type = "text"
             elif file_extension in ['png', 'jpg', 'jpeg', 'bmp', 'tiff']:
-                extracted_text = self.extract_text_from_image(file_data)
+                extracted_text = self.extract_text_from_image(file_obj)
                 file_type = "image"
             else:
                 raise ValueError(f"Unsupported file type: {file_extension}")
             
-            # Clean up extracted text
-            extracted_text = self.clean_text(extracted_text)
+            # Clean up extracted text (text files are already collapsed while decoding)
+            if file_type == "text":
+                extracted_text = self._drop_noise(extracted_text)
+            else:
+                extracted_text = self.clean_text(extracted_text)
             
             return extracted_text, file_type
             
@@ -151,13 +363,14 @@ class UploadHandler:
         if not text:
             return ""
         
-        # Remove extra whitespace
-        text = " ".join(text.split())
-        
-        # Remove very short lines (likely OCR noise) - reduced threshold from 3 to 2 to preserve more content
-        lines = [line.strip() for line in text.split('\n') if len(line.strip()) > 2]
-        
-        return '\n'.join(lines)
+        # Remove extra whitespace (split/join runs in C and beats re.sub, with or
+        # without a bytes.translate pre-pass; it also covers Unicode whitespace)
+        return self._drop_noise(" ".join(text.split()))
+    
+    def _drop_noise(self, text: str) -> str:
+        """Drop whitespace-collapsed text that is very short (likely OCR noise)"""
+        # Collapsed text is a single line; threshold 2 to preserve more content
+        return text if len(text) > 2 else ""
     
     def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
         """
@@ -176,17 +389,21 @@ class UploadHandler:
         
         chunks = []
         start = 0
+        text_len = len(text)
+        rfind = text.rfind
         
-        while start < len(text):
+        while start < text_len:
             end = start + chunk_size
             
             # Try to break at sentence boundary
-            if end < len(text):
-                # Look for sentence endings near the end
-                for i in range(end, max(start + chunk_size - 100, start), -1):
-                    if text[i] in '.!?':
-                        end = i + 1
-                        break
+            if end < text_len:
+                # Look for the last sentence ending in (end - 100, end]
+                window_start = max(end - 100, start) + 1
+                i = max(rfind('.', window_start, end + 1),
+                        rfind('!', window_start, end + 1),
+                        rfind('?', window_start, end + 1))
+                if i != -1:
+                    end = i + 1
             
             chunk = text[start:end].strip()
             if chunk:
@@ -201,5 +418,7 @@ class UploadHandler:
         
         return chunks
 
-# Global handler instance
-upload_handler = UploadHandler()
+@st.cache_resource
+def get_upload_handler() -> UploadHandler:
+    """Shared handler instance, created on first upload"""
+    return UploadHandler()
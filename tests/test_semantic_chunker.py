@@ -0,0 +1,40 @@
+from src.chunking.semantic_chunker import semantic_chunk
+
+
+def _body_words(chunks, headings):
+    words = []
+    for chunk in chunks:
+        heading, _, body = chunk.partition("\n")
+        assert heading in headings
+        words.extend(body.split())
+    return words
+
+
+def test_small_max_chars_emits_heading_once_per_chunk():
+    lines = [f"Line {i} has words. More words here" for i in range(6)]
+    text = "INTRODUCTION\n" + "\n".join(lines) + "\nMETHODS\nShort methods text. End"
+
+    chunks = semantic_chunk(text, max_chars=300)
+
+    assert chunks == [
+        "INTRODUCTION\n" + " ".join(lines),
+        "METHODS\nShort methods text. End",
+    ]
+
+
+def test_small_max_chars_never_breaks_inside_numbered_heading():
+    text = "1.2 Overview\nabc def. ghi jkl\nmno pqr. stu"
+
+    assert semantic_chunk(text, max_chars=300) == ["1.2 Overview\nabc def. ghi jkl mno pqr. stu"]
+
+
+def test_small_max_chars_keeps_every_word_once():
+    lines = [f"Sentence number {i} is here. It ends now" for i in range(40)]
+    text = "2.1 RESULTS\n" + "\n".join(lines)
+
+    chunks = semantic_chunk(text, max_chars=400)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert all(chunk.count("2.1 RESULTS") == 1 for chunk in chunks)
+    assert _body_words(chunks, {"2.1 RESULTS"}) == " ".join(lines).split()